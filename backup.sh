@@ -1,2 +1,2 @@
 #!/bin/bash
-.venv/bin/python3 src/restic.py --backup 
+.venv/bin/python3 src/restic.py --all
@@ -0,0 +1,69 @@
+"""
+Startup time of the wrapper, measured with python -X importtime
+
+    python benchmarks/startup_benchmark.py
+
+Imports src/restic.py like a cron job does (--backup) and fails if the import takes longer than
+BUDGET_MS or if one of the interactive or download modules is imported on the way.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+# median of RUNS imports of restic.py, milliseconds
+BUDGET_MS = 150
+RUNS = 5
+
+# only needed by interactive commands or to download restic
+LAZY_MODULES = ["questionary", "prompt_toolkit", "requests", "tqdm", "libs.GitHub", "libs.Tuner", "libs.Daemon", "concurrent.futures"]
+
+SRC_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+def importtime():
+    """
+    import restic in a fresh interpreter
+    :return: dict module -> cumulative microseconds
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import restic"], cwd=SRC_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr.strip().splitlines()[-1])
+        sys.exit(2)
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") is False or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            modules[parts[2].strip()] = int(parts[1])
+        except ValueError:
+            pass  # header line
+    return modules
+
+
+def main():
+    runs = [importtime() for i in range(RUNS)]
+    median = statistics.median(run["restic"] for run in runs) / 1000
+
+    print(f"import restic: {median:.1f} ms (budget {BUDGET_MS} ms)")
+    print("slowest imports:")
+    slowest = sorted(((us, name) for name, us in runs[-1].items() if "." not in name), reverse=True)[:10]
+    for us, name in slowest:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    ok = True
+    loaded = [name for name in LAZY_MODULES if name in runs[-1]]
+    if len(loaded) > 0:
+        print(f"FAILED: imported at startup, should be lazy: {', '.join(loaded)}")
+        ok = False
+    if median > BUDGET_MS:
+        print(f"FAILED: over budget by {median - BUDGET_MS:.1f} ms")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
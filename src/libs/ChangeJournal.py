@@ -0,0 +1,193 @@
+import json
+import os
+import time
+from datetime import datetime
+
+
+class ChangeJournal:
+    """
+    Paths changed under the include roots of a profile, written by the watcher (--watch) and read by the backup.
+    The journal is a file of NUL terminated paths, like restic --files-from-raw reads them.
+    A backup takes the journal and backs up only those paths, unless a full backup is due:
+    no full backup yet, full_every days passed, the journal overflowed or the watcher was not running all the time.
+    """
+
+    DEFAULTS = {
+        "enabled": True,
+        "full_every": 7,  # days
+        "max_paths": 50000,  # more changed paths and the next backup is a full one
+    }
+
+    HEARTBEAT = 5  # seconds between two writes of the watcher
+    STALE = 60  # seconds without heartbeat, the watcher is not running
+
+    def __init__(self, stateDir, profile_name, settings=None):
+        """
+        :param stateDir: bin/state
+        :param profile_name: name of the profile
+        :param settings: watch block of the profile
+        """
+        self.settings = dict(self.DEFAULTS)
+        self.settings.update(settings or {})
+        self.journalFile = os.path.join(stateDir, f"{profile_name}-changes.journal")
+        self.overflowFile = os.path.join(stateDir, f"{profile_name}-changes.overflow")
+        self.watcherFile = os.path.join(stateDir, f"{profile_name}-watcher.json")
+        self.stateFile = os.path.join(stateDir, f"{profile_name}-changes.json")
+        self.takenFile = f"{self.journalFile}.taken"
+        os.makedirs(stateDir, exist_ok=True)
+
+    @staticmethod
+    def validate(settings):
+        """
+        check a watch block
+        :return: list of error messages
+        """
+        if isinstance(settings, dict) is False:
+            return ["watch: must be a block of settings"]
+        errors = [f"watch.{key}: unknown setting" for key in settings if key not in ChangeJournal.DEFAULTS]
+        if isinstance(settings.get("enabled", True), bool) is False:
+            errors.append("watch.enabled: must be true or false")
+        for key in ["full_every", "max_paths"]:
+            value = settings.get(key, ChangeJournal.DEFAULTS[key])
+            if isinstance(value, int) is False or value < 1:
+                errors.append(f"watch.{key}: must be a number >= 1")
+        return errors
+
+    def _lock(self, fh):
+        try:
+            import fcntl
+
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        except ImportError:
+            pass
+
+    def _readJson(self, filename):
+        try:
+            with open(filename, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def _writeJson(self, filename, data):
+        tmp = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, indent=2)
+        os.replace(tmp, filename)
+
+    # watcher side ---------------------------------------------------
+
+    def append(self, paths):
+        """add changed paths, more than max_paths in the journal is an overflow"""
+        while True:
+            fh = open(self.journalFile, "ab")
+            self._lock(fh)
+            try:
+                current = os.stat(self.journalFile).st_ino == os.fstat(fh.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                break
+            # the backup took the journal while we waited for the lock
+            fh.close()
+        with fh:
+            fh.write(b"".join(os.fsencode(path) + b"\0" for path in paths))
+            size = fh.tell()
+        # a rough limit, paths are seldom longer than 200 bytes
+        if size > self.settings["max_paths"] * 200:
+            self.overflow()
+
+    def overflow(self):
+        """changes got lost (inotify queue, watch limit), the next backup has to be a full one"""
+        with open(self.overflowFile, "w", encoding="utf-8") as fh:
+            fh.write(datetime.now().isoformat(timespec="seconds"))
+
+    def heartbeat(self, started):
+        """the watcher runs since started (time.time())"""
+        self._writeJson(self.watcherFile, {"pid": os.getpid(), "started": started, "heartbeat": time.time()})
+
+    # backup side ----------------------------------------------------
+
+    def watcherRunning(self, since):
+        """did the watcher run all the time since `since` (time.time()) and does it still run"""
+        status = self._readJson(self.watcherFile)
+        if "heartbeat" not in status:
+            return False
+        return status["started"] <= since and time.time() - status["heartbeat"] < self.STALE
+
+    @staticmethod
+    def compact(paths):
+        """unique existing paths, a path below another one is left out"""
+        result = []
+        for path in sorted(set(paths)):
+            if os.path.lexists(path) is False:
+                # gone again, the next full backup sees it
+                continue
+            if result and (path == result[-1] or path.startswith(result[-1].rstrip(os.sep) + os.sep)):
+                continue
+            result.append(path)
+        return result
+
+    def plan(self, parent):
+        """
+        take the journal and decide between a full backup and one of the changed paths
+        the journal is moved aside, the watcher starts a new one, finished() removes or returns it
+        :param parent: id of the last full snapshot, None if there is none
+        :return: list of changed paths or None for a full backup, reason
+        """
+        state = self._readJson(self.stateFile)
+        self._take()
+
+        if parent is None or "last_full" not in state:
+            return None, "no full backup yet"
+        if os.path.exists(self.overflowFile):
+            return None, "journal overflow"
+        if time.time() - state["last_full"] > self.settings["full_every"] * 86400:
+            return None, f"last full backup older than {self.settings['full_every']} days"
+        if self.watcherRunning(state.get("last_backup", state["last_full"])) is False:
+            return None, "watcher was not running"
+
+        paths = []
+        if os.path.exists(self.takenFile):
+            with open(self.takenFile, "rb") as fh:
+                paths = [os.fsdecode(path) for path in fh.read().split(b"\0") if path]
+        if len(set(paths)) > self.settings["max_paths"]:
+            return None, "too many changes"
+        return self.compact(paths), f"{len(paths)} changes"
+
+    def _take(self):
+        """move the journal to the taken ones, the watcher starts a new journal, a failed backup left the old ones"""
+        if os.path.exists(self.journalFile) is False:
+            return
+        moving = f"{self.journalFile}.{os.getpid()}"
+        os.replace(self.journalFile, moving)
+        with open(moving, "rb") as fh:
+            # wait for a watcher still writing into it
+            self._lock(fh)
+            data = fh.read()
+        with open(self.takenFile, "ab") as fh:
+            fh.write(data)
+        os.remove(moving)
+
+    def finished(self, ok, full, started):
+        """
+        after the backup: on success the taken journal is removed, else it is kept for the next backup
+        :param full: it was a full backup
+        :param started: time.time() when the journal was taken
+        """
+        if ok is False:
+            return
+        state = self._readJson(self.stateFile)
+        state["last_backup"] = started
+        if full:
+            state["last_full"] = started
+            try:
+                # an overflow during the backup still counts
+                if os.stat(self.overflowFile).st_mtime < started:
+                    os.remove(self.overflowFile)
+            except OSError:
+                pass
+        self._writeJson(self.stateFile, state)
+        try:
+            os.remove(self.takenFile)
+        except OSError:
+            pass
@@ -0,0 +1,190 @@
+import ctypes
+import ctypes.util
+import errno
+import glob
+import os
+import select
+import struct
+import time
+
+
+class Inotify:
+    """the inotify calls of the Linux libc"""
+
+    MODIFY = 0x00000002
+    ATTRIB = 0x00000004
+    CLOSE_WRITE = 0x00000008
+    MOVED_FROM = 0x00000040
+    MOVED_TO = 0x00000080
+    CREATE = 0x00000100
+    DELETE = 0x00000200
+    DELETE_SELF = 0x00000400
+    MOVE_SELF = 0x00000800
+    Q_OVERFLOW = 0x00004000
+    IGNORED = 0x00008000
+    ONLYDIR = 0x01000000
+    DONT_FOLLOW = 0x02000000
+    EXCL_UNLINK = 0x04000000
+    ISDIR = 0x40000000
+
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def addWatch(self, path, mask):
+        """:return: watch descriptor, raises OSError (ENOSPC: max_user_watches reached)"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()), path)
+        return wd
+
+    def read(self, timeout):
+        """
+        wait up to timeout seconds for events
+        :return: list of (wd, mask, name)
+        """
+        if len(select.select([self.fd], [], [], timeout)[0]) == 0:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ChangeWatcher:
+    """
+    Watches the include roots of profiles with inotify (Linux) and writes changed paths into their ChangeJournal.
+    New and changed files are recorded, a new directory as a whole. Deleted files are not,
+    the next full backup sees them. Changes which could not be watched make the journal overflow.
+    """
+
+    # changes of the content or the metadata of a file, new entries of a directory
+    # MODIFY for files which stay open (logs, databases) and never send CLOSE_WRITE, pending is a set
+    FILE_EVENTS = Inotify.MODIFY | Inotify.CLOSE_WRITE | Inotify.ATTRIB | Inotify.CREATE | Inotify.MOVED_TO
+    MASK = FILE_EVENTS | Inotify.MOVED_FROM | Inotify.DELETE | Inotify.DELETE_SELF | Inotify.MOVE_SELF | Inotify.ONLYDIR | Inotify.DONT_FOLLOW | Inotify.EXCL_UNLINK
+
+    def __init__(self, term=None):
+        self.term = term
+        self.inotify = None
+        self.watches = {}  # wd -> directory
+        self.roots = {}  # profile -> (list of roots, ChangeJournal)
+        self.pending = {}  # profile -> set of changed paths
+        self.running = False
+
+    @staticmethod
+    def includeRoots(patterns):
+        """directories of the include patterns, up to the first wildcard"""
+        roots = []
+        for pattern in patterns:
+            parts = []
+            for part in str(pattern).split(os.sep):
+                if glob.has_magic(part):
+                    break
+                parts.append(part)
+            root = os.sep.join(parts) or os.sep
+            if os.path.isfile(root):
+                root = os.path.dirname(root)
+            if os.path.isdir(root):
+                roots.append(os.path.abspath(root))
+        return roots
+
+    def add(self, profile_name, patterns, journal):
+        """watch the include patterns of a profile"""
+        self.roots[profile_name] = (self.includeRoots(patterns), journal)
+        self.pending[profile_name] = set()
+
+    def print(self, text, color="DEFAULT"):
+        if self.term is not None:
+            self.term.print(text, color)
+
+    def profilesOf(self, path):
+        return [name for name, (roots, journal) in self.roots.items() if any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)]
+
+    def watchTree(self, top):
+        """add watches for a directory and everything below it"""
+        for directory, dirs, files in os.walk(top):
+            try:
+                self.watches[self.inotify.addWatch(directory, self.MASK)] = directory
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    self.print(f"inotify watch limit reached at {directory}, raise fs.inotify.max_user_watches", "RED")
+                    for name in self.profilesOf(directory):
+                        self.roots[name][1].overflow()
+                    return
+                # gone or not readable
+                dirs[:] = []
+
+    def record(self, path):
+        for name in self.profilesOf(path):
+            self.pending[name].add(path)
+
+    def handle(self, wd, mask, name):
+        if mask & Inotify.Q_OVERFLOW:
+            self.print("inotify queue overflow, the next backups are full ones", "RED")
+            for roots, journal in self.roots.values():
+                journal.overflow()
+            return
+        if mask & Inotify.IGNORED:
+            self.watches.pop(wd, None)
+            return
+        directory = self.watches.get(wd)
+        if directory is None or name == "":
+            return
+
+        path = os.path.join(directory, name)
+        if mask & Inotify.ISDIR and mask & (Inotify.CREATE | Inotify.MOVED_TO):
+            # a new directory, its content may already be there
+            self.watchTree(path)
+            self.record(path)
+        elif mask & self.FILE_EVENTS:
+            self.record(path)
+
+    def flush(self, started):
+        for name, (roots, journal) in self.roots.items():
+            if self.pending[name]:
+                journal.append(sorted(self.pending[name]))
+                self.pending[name] = set()
+            journal.heartbeat(started)
+
+    def run(self):
+        """watch until stop() or Ctrl+C"""
+        self.inotify = Inotify()
+        started = time.time()
+        for name, (roots, journal) in self.roots.items():
+            self.print(f"Watching [{name}] {', '.join(roots)}")
+            for root in roots:
+                self.watchTree(root)
+        self.print(f"{len(self.watches)} directories watched")
+
+        self.running = True
+        lastFlush = time.monotonic()
+        interval = min(journal.HEARTBEAT for roots, journal in self.roots.values())
+        self.flush(started)
+        try:
+            while self.running:
+                for wd, mask, name in self.inotify.read(interval):
+                    self.handle(wd, mask, name)
+                if time.monotonic() - lastFlush >= interval:
+                    self.flush(started)
+                    lastFlush = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.flush(started)
+            self.inotify.close()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,115 @@
+import json
+import math
+import os
+from datetime import datetime, timedelta
+
+
+class CheckRotation:
+    """
+    Spreads `restic check --read-data` over several runs with --read-data-subset=n/N.
+    Every run reads the next subset, with a time budget more subsets are read while time is left,
+    so all packs are read once in read_data_days days if the check runs daily.
+    The last read of every subset is kept in a state file.
+    """
+
+    DEFAULTS = {
+        "read_data_days": 30,
+        "max_seconds": 0,
+        "max_bytes": 0,
+    }
+
+    def __init__(self, settings, stateFile):
+        """
+        :param settings: check block of the profile, missing keys use DEFAULTS
+        :param stateFile: json file with the rotation state of the profile
+        """
+        self.settings = dict(self.DEFAULTS)
+        self.settings.update(settings or {})
+        self.stateFile = stateFile
+        self.state = self._load()
+
+    @staticmethod
+    def validate(settings):
+        """
+        check a check block
+        :return: list of error messages
+        """
+        if isinstance(settings, dict) is False:
+            return ["check: must be a block of settings"]
+        errors = [f"check.{key}: unknown setting" for key in settings if key not in CheckRotation.DEFAULTS]
+        for key in CheckRotation.DEFAULTS:
+            value = settings.get(key, 0)
+            if isinstance(value, int) is False or value < 0:
+                errors.append(f"check.{key}: must be a number >= 0")
+        return errors
+
+    def _load(self):
+        try:
+            with open(self.stateFile, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {"subsets": 0, "next": 1, "done": {}, "repo_bytes": 0}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.stateFile), exist_ok=True)
+        tmp = f"{self.stateFile}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh, indent=2)
+        os.replace(tmp, self.stateFile)
+
+    def isEnabled(self):
+        return self.settings["read_data_days"] > 0
+
+    def needsRepoSize(self):
+        return self.settings["max_bytes"] > 0
+
+    def plan(self, repo_bytes=0):
+        """
+        number of subsets N, from read_data_days and the byte budget
+        a new N starts the rotation again
+        :param repo_bytes: size of the pack files, needed with max_bytes
+        """
+        subsets = self.settings["read_data_days"]
+        if self.needsRepoSize() and repo_bytes > 0:
+            self.state["repo_bytes"] = repo_bytes
+            subsets = max(subsets, math.ceil(repo_bytes / (self.settings["max_bytes"] * 1024 * 1024)))
+
+        if subsets != self.state["subsets"]:
+            self.state = {"subsets": subsets, "next": 1, "done": {}, "repo_bytes": self.state.get("repo_bytes", 0)}
+        return subsets
+
+    def nextSubset(self):
+        """the option for the next subset, e.g. --read-data-subset=3/30"""
+        return f"--read-data-subset={self.state['next']}/{self.state['subsets']}"
+
+    def finished(self, ok):
+        """the actual subset was read, on success the rotation moves on"""
+        if ok:
+            self.state["done"][str(self.state["next"])] = datetime.now().isoformat(timespec="seconds")
+            self.state["next"] = self.state["next"] % self.state["subsets"] + 1
+        self.save()
+
+    def hasTimeFor(self, elapsed, lastDuration, readThisRun):
+        """is there time for another subset in this run"""
+        if self.settings["max_seconds"] == 0 or readThisRun >= self.state["subsets"]:
+            return False
+        return elapsed + lastDuration <= self.settings["max_seconds"]
+
+    def coverage(self):
+        """how much of the repository was read in the last read_data_days days"""
+        now = datetime.now()
+        window = timedelta(days=self.settings["read_data_days"])
+        subsets = self.state["subsets"]
+        reads = [datetime.fromisoformat(value) for value in self.state["done"].values()]
+        recent = [read for read in reads if now - read <= window]
+        oldest = None
+        if len(reads) == subsets and subsets > 0:
+            oldest = round((now - min(reads)).total_seconds() / 86400, 1)
+        return {
+            "subsets": subsets,
+            "next_subset": self.state["next"],
+            "read_in_window": len(recent),
+            "coverage_percent": round(100 * len(recent) / subsets, 1) if subsets > 0 else 0,
+            "oldest_read_days": oldest,
+            "overdue": len(reads) == subsets and len(recent) < subsets,
+        }
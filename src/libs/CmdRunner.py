@@ -15,13 +15,15 @@ class CmdRunner:
     def __init__(self):
         self._stderr = ""
         self._stdout = ""
-        self._stdout_list = []
-        self._stderr_list = []
         self.pid = None
         self._thread = None
         self._finished = threading.Event()
         self._spinner = None
         self.spinnerText = None
+        self.returncode = None
+
+        self._budget = None  # ResourceBudget for the child process
+        self._watchers = []  # objects with attach(pid) and detach(), e.g. RssWatcher
 
         self._suppress_realtime = False  # flag for suppressing realtime output
         self._buffered_output = []  # Buffer to store output when suppressed
@@ -41,6 +43,25 @@ class CmdRunner:
     def getStdOut(self):
         return self._stdout
 
+    def set_budget(self, budget):
+        """Set a ResourceBudget applied to every command"""
+        self._budget = budget
+
+    def add_process_watcher(self, watcher):
+        """Add a watcher, which is attached to the child process while it runs"""
+        self._watchers.append(watcher)
+
+    def clear_process_watchers(self):
+        """Remove all watchers"""
+        self._watchers = []
+
+    def getWatcherStats(self):
+        """merged stats of all watchers"""
+        stats = {}
+        for watcher in self._watchers:
+            stats.update(watcher.stats())
+        return stats
+
     def set_suppress_realtime(self, suppress: bool):
         """Set whether to suppress realtime output"""
         self._suppress_realtime = suppress
@@ -125,36 +146,42 @@ class CmdRunner:
             self._buffered_output.clear()
 
     def getStdOutLines(self):
-        """get StdOut in an list"""
-        return self._stdout_list
+        """get StdOut of the last command in an list"""
+        return self._stdout.splitlines(keepends=True)
 
     def getStdErrLines(self):
-        """get StdOut in an list"""
-        return self._stderr_list
+        """get StdErr of the last command in an list"""
+        return self._stderr.splitlines(keepends=True)
 
     def _execute_command(self, cmd, is_ps=False):
         self._stderr = ""
         self._stdout = ""
 
+        env = None
+        if self._budget is not None:
+            env = self._budget.environment()
+            if not is_ps:
+                cmd = self._budget.wrapCommand(cmd)
+
         if is_ps:
-            proc = subprocess.Popen(["powershell.exe", cmd], shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, preexec_fn=None)
+            proc = subprocess.Popen(["powershell.exe", cmd], shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, env=env)
         else:
-            proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, preexec_fn=None)
+            proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, env=env)
 
         self.pid = proc.pid
+        for watcher in self._watchers:
+            watcher.attach(proc.pid)
 
         def read_stderr():
             for line in iter(proc.stderr.readline, b""):
                 decoded_line = line.decode("utf-8", "ignore")
                 self._stderr += decoded_line
-                self._stderr_list.append(decoded_line)
                 self._notify_stderr(decoded_line)
 
         def read_stdout():
             for line in iter(proc.stdout.readline, b""):
                 decoded_line = line.decode("utf-8", "ignore")
                 self._stdout += decoded_line
-                self._stdout_list.append(decoded_line)
                 self._notify_stdout(decoded_line)
 
         # Create and start threads for reading stdout and stderr
@@ -168,6 +195,9 @@ class CmdRunner:
         stdout_thread.join()
 
         proc.communicate()
+        for watcher in self._watchers:
+            watcher.detach()
+        self.returncode = proc.returncode
         self._finished.set()
         self._notify_completion()
 
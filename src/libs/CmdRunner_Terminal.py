@@ -6,12 +6,37 @@ from typing import Optional, Union, List, Callable
 
 
 class CmdRunner_Terminal:
-    def __init__(self, working_directory: Optional[str] = None):
+    def __init__(self, working_directory: Optional[str] = None, output_file: Optional[str] = None):
         """Initialize command runner.
-        :param working_directory: Path to working directory, uses current if None"""
+        :param working_directory: Path to working directory, uses current if None
+        :param output_file: append stdout and stderr to this file instead of the terminal"""
         self.working_directory = working_directory or os.getcwd()
+        self.output_file = output_file
         self.process = None
         self.on_complete_callback: Optional[Callable] = None
+        self.returncode = None
+
+        self._budget = None  # ResourceBudget for the child process
+        self._watchers = []  # objects with attach(pid) and detach(), e.g. RssWatcher
+
+    def set_budget(self, budget):
+        """Set a ResourceBudget applied to every command"""
+        self._budget = budget
+
+    def add_process_watcher(self, watcher):
+        """Add a watcher, which is attached to the child process while it runs"""
+        self._watchers.append(watcher)
+
+    def clear_process_watchers(self):
+        """Remove all watchers"""
+        self._watchers = []
+
+    def getWatcherStats(self):
+        """merged stats of all watchers"""
+        stats = {}
+        for watcher in self._watchers:
+            stats.update(watcher.stats())
+        return stats
 
     def set_complete_callback(self, callback: Callable[[int], None]):
         """Set callback for process completion.
@@ -25,21 +50,51 @@ class CmdRunner_Terminal:
         if isinstance(command, list):
             command = " ".join(command)
 
+        env = None
+        if self._budget is not None:
+            env = self._budget.environment()
+            command = self._budget.wrapCommand(command)
+
+        output = None
         try:
+            if self.output_file is not None:
+                output = open(self.output_file, "a", encoding="utf-8")
+
             # This will block until the process completes
-            completed_process = subprocess.run(command, shell=True, cwd=self.working_directory, check=True, text=True)  # This will raise an exception if the command fails
+            self.process = subprocess.Popen(command, shell=True, cwd=self.working_directory, text=True, env=env, stdout=output, stderr=None if output is None else subprocess.STDOUT)
+            self._wait(timeout)
 
-            if self.on_complete_callback:
-                self.on_complete_callback(completed_process.returncode)
+            if self.returncode != 0:
+                print(f"Command failed with return code {self.returncode}")
+            self._complete()
 
-        except subprocess.CalledProcessError as e:
-            print(f"Command failed with return code {e.returncode}")
-            if self.on_complete_callback:
-                self.on_complete_callback(e.returncode)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.returncode = self.process.wait()
+            print(f"Command timed out after {timeout} seconds")
+            self._complete()
 
         except Exception as e:
             print(f"Failed to execute command: {e}")
 
+        finally:
+            if output is not None:
+                output.close()
+
+    def _wait(self, timeout):
+        """wait for the process, the watchers are attached meanwhile"""
+        for watcher in self._watchers:
+            watcher.attach(self.process.pid)
+        try:
+            self.returncode = self.process.wait(timeout=timeout)
+        finally:
+            for watcher in self._watchers:
+                watcher.detach()
+
+    def _complete(self):
+        if self.on_complete_callback:
+            self.on_complete_callback(self.returncode)
+
     def close(self):
         """Cleanup method (kept for compatibility)"""
         pass
@@ -0,0 +1,162 @@
+import glob
+import json
+import math
+import os
+
+
+class CompressionSplit:
+    """
+    Splits the include list of a profile into data worth compressing and data which is compressed already.
+    The extension decides, an unknown one the entropy of the first SAMPLE bytes.
+    A directory holding only incompressible files is taken as a whole, so the list stays short,
+    everything else stays in the normal backup, which excludes the incompressible entries.
+    """
+
+    DEFAULTS = {
+        "enabled": True,
+        "compressible": "max",  # --compression of the normal backup
+        "incompressible": "off",  # --compression of media, archives, ...
+        "entropy": 7.5,  # bits per byte, above it a file counts as incompressible
+    }
+
+    SAMPLE = 4096
+
+    INCOMPRESSIBLE = {
+        # images, audio, video
+        "jpg", "jpeg", "png", "gif", "webp", "heic", "heif", "avif", "jxl", "mp3", "m4a", "aac", "ogg", "opus", "flac",
+        "mp4", "m4v", "mkv", "avi", "mov", "webm", "wmv",
+        # archives and packages
+        "zip", "gz", "tgz", "bz2", "xz", "zst", "7z", "rar", "lz4", "jar", "apk", "deb", "rpm", "whl", "cab",
+        # compressed documents
+        "docx", "xlsx", "pptx", "odt", "ods", "odp", "epub",
+    }
+
+    COMPRESSIBLE = {
+        "txt", "log", "csv", "tsv", "json", "xml", "html", "htm", "css", "js", "ts", "py", "c", "h", "cpp", "java",
+        "go", "rs", "sql", "md", "rst", "yml", "yaml", "ini", "conf", "cfg", "svg", "tex", "rtf", "sh", "bat", "ps1",
+    }
+
+    def __init__(self, settings, cacheFile):
+        """
+        :param settings: compression_split block of the profile
+        :param cacheFile: json file with the entropy of already sampled files
+        """
+        self.settings = dict(self.DEFAULTS)
+        self.settings.update(settings or {})
+        self.cacheFile = cacheFile
+        self.cache = self._load()
+        self.fresh = {}  # entropy of the files seen by split()
+        self.sampled = 0
+
+    @staticmethod
+    def validate(settings, modes):
+        """
+        check a compression_split block
+        :param modes: valid compression modes
+        :return: list of error messages
+        """
+        if isinstance(settings, dict) is False:
+            return ["compression_split: must be a block of settings"]
+        errors = [f"compression_split.{key}: unknown setting" for key in settings if key not in CompressionSplit.DEFAULTS]
+        if isinstance(settings.get("enabled", True), bool) is False:
+            errors.append("compression_split.enabled: must be true or false")
+        for key in ["compressible", "incompressible"]:
+            # yaml reads an unquoted off as false
+            if settings.get(key, CompressionSplit.DEFAULTS[key]) not in list(modes) + [False]:
+                errors.append(f"compression_split.{key}: must be one of {', '.join(modes)}")
+        entropy = settings.get("entropy", CompressionSplit.DEFAULTS["entropy"])
+        if isinstance(entropy, (int, float)) is False or not 0 < entropy <= 8:
+            errors.append("compression_split.entropy: must be a number between 0 and 8")
+        return errors
+
+    def getMode(self, group):
+        """--compression of a group, compressible or incompressible"""
+        mode = self.settings[group]
+        return "off" if mode is False else mode
+
+    def _load(self):
+        try:
+            with open(self.cacheFile, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """keep the entropy of files still there"""
+        os.makedirs(os.path.dirname(self.cacheFile), exist_ok=True)
+        tmp = f"{self.cacheFile}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.cache, fh)
+        os.replace(tmp, self.cacheFile)
+
+    @staticmethod
+    def entropy(data):
+        """shannon entropy in bits per byte"""
+        if len(data) == 0:
+            return 0
+        counts = [0] * 256
+        for byte in data:
+            counts[byte] += 1
+        return -sum(count / len(data) * math.log2(count / len(data)) for count in counts if count)
+
+    def isIncompressible(self, path, stat):
+        extension = os.path.splitext(path)[1][1:].lower()
+        if extension in self.INCOMPRESSIBLE:
+            return True
+        if extension in self.COMPRESSIBLE or stat.st_size < self.SAMPLE:
+            return False
+
+        key = f"{stat.st_size}:{stat.st_mtime_ns}"
+        cached = self.cache.get(path)
+        if cached is None or cached[0] != key:
+            try:
+                with open(path, "rb") as fh:
+                    cached = [key, round(self.entropy(fh.read(self.SAMPLE)), 2)]
+            except OSError:
+                return False
+            self.sampled += 1
+        self.fresh[path] = cached
+        return cached[1] > self.settings["entropy"]
+
+    def split(self, patterns):
+        """
+        the incompressible entries of the include patterns, files or whole directories
+        :return: list of paths
+        """
+        self.fresh = {}
+        self.sampled = 0
+        entries = []
+        for pattern in patterns:
+            for path in glob.glob(str(pattern)) if glob.has_magic(str(pattern)) else [str(pattern)]:
+                if os.path.isdir(path) and os.path.islink(path) is False:
+                    entries += self._splitTree(path)
+                elif os.path.isfile(path) and os.path.islink(path) is False and self.isIncompressible(path, os.stat(path)):
+                    entries.append(path)
+        # drop the entropy of files which are gone
+        self.cache = self.fresh
+        self.save()
+        return entries
+
+    def _splitTree(self, top):
+        entries = []
+        wholeDirs = set()
+        for directory, dirs, files in os.walk(top, topdown=False):
+            incompressible = []
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.lstat(path)
+                except OSError:
+                    continue
+                if os.path.islink(path) is False and self.isIncompressible(path, stat):
+                    incompressible.append(path)
+            subdirs = [os.path.join(directory, name) for name in dirs]
+            whole = [subdir for subdir in subdirs if subdir in wholeDirs]
+            if (files or dirs) and len(incompressible) == len(files) and len(whole) == len(subdirs):
+                # nothing to compress below this directory, take it as a whole
+                wholeDirs.add(directory)
+                wholeDirs.difference_update(whole)
+            else:
+                entries += incompressible + whole
+                wholeDirs.difference_update(whole)
+        return entries + [directory for directory in wholeDirs]
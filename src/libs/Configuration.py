@@ -1,9 +1,19 @@
 import yaml
+import copy
 import logging
 import random
 import os
 from pathlib import Path
+from libs.ChangeJournal import ChangeJournal
+from libs.CheckRotation import CheckRotation
+from libs.CompressionSplit import CompressionSplit
+from libs.Hooks import Hooks
 from libs.OSDetector import OSDetector
+from libs.LoadThrottle import LoadThrottle
+from libs.ResourceBudget import ResourceBudget
+from libs.Scheduler import Schedule
+from libs.ShardPlanner import ShardPlanner
+from libs.StreamSources import StreamSources
 
 
 class Configuration:
@@ -14,6 +24,38 @@ class Configuration:
     num = "0123456789"
     sym = "!@#$%^&*"
 
+    # restic performance tuning of a profile, a key missing in config.yml falls back to these values
+    TUNING_DEFAULTS = {
+        "compression": "auto",
+        "pack_size": 16,
+        "read_concurrency": 2,
+        "limit_upload": 0,
+        "limit_download": 0,
+        "connections": 0,
+        "no_scan": False,
+        "ignore_inode": False,
+        "ignore_ctime": False,
+        "cache_dir": "",
+        "cache_max_size": 1024,
+    }
+
+    COMPRESSION_MODES = ("auto", "off", "max", "fastest", "better")
+
+    # settings.yml next to config.yml, for the wrapper itself and not for a profile
+    SETTINGS_DEFAULTS = {
+        "restic_version": "",
+        "restic_mirror": "",
+        "release_cache_ttl": 3600,
+        "max_per_backend": 2,
+        "backend_limits": {},
+    }
+
+    # parsed config files of this process: path -> ((mtime, size), dict)
+    _cache = {}
+
+    # libyaml is a lot faster, if PyYAML was built with it
+    Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
     def __init__(self, configFile):
         """
         :param configFile: Full Path to config File
@@ -34,6 +76,7 @@ class Configuration:
                     "storage": os.path.abspath(os.path.join(self.rootDir, "..", "STORAGE")),
                     "include": ["**/*", "C:\\Test"],
                     "exclude": ["Thumbs.db", "*.iso", "**/node_modules/**", "AI/**", ".lock*", "GitHub"],
+                    **self.TUNING_DEFAULTS,
                 }
             }
         if OSDetector.is_linux():
@@ -57,10 +100,92 @@ class Configuration:
                         "/root/.local/**",
                         "/root/snap/**",
                     ],
+                    **self.TUNING_DEFAULTS,
                 }
             }
         return config_dict
 
+    def validateProfile(self, profile):
+        """
+        check the tuning options and the blocks of a profile
+        :param profile: dict of the profile
+        :return: list of error messages, empty if everything is fine
+        """
+        errors = self.validateTuning(profile)
+        errors += self.validateAccess(profile)
+        for key, validate in self.blockValidators():
+            if key in profile:
+                errors += validate(profile[key])
+        for key, others in [("compression_split", ["shards", "watch"]), ("shards", ["watch"])]:
+            if key in profile and any(other in profile for other in others):
+                errors.append(f"{key}: can not be used together with {' or '.join(others)}")
+        return errors
+
+    def validateTuning(self, profile):
+        """the tuning options of a profile, missing ones use TUNING_DEFAULTS"""
+        options = dict(self.TUNING_DEFAULTS)
+        options.update({key: value for key, value in profile.items() if key in self.TUNING_DEFAULTS})
+        if options["compression"] is False:
+            # yaml reads an unquoted off as false
+            options["compression"] = "off"
+
+        # option -> (check, message)
+        rules = {
+            "compression": (lambda value: value in self.COMPRESSION_MODES, f"must be one of {', '.join(self.COMPRESSION_MODES)}"),
+            "pack_size": (lambda value: self._isInt(value) and 4 <= value <= 128, "must be a number between 4 and 128 (MiB)"),
+            "read_concurrency": (lambda value: self._isInt(value) and value >= 1, "must be a number >= 1"),
+            "cache_dir": (lambda value: value is None or isinstance(value, str), "must be a path"),
+        }
+        for key in ["limit_upload", "limit_download", "connections", "cache_max_size"]:
+            rules[key] = (lambda value: self._isInt(value) and value >= 0, "must be a number >= 0 (0 = default / unlimited)")
+        for key in ["no_scan", "ignore_inode", "ignore_ctime"]:
+            rules[key] = (lambda value: isinstance(value, bool), "must be true or false")
+        return [f"{key}: {message}" for key, (check, message) in rules.items() if check(options[key]) is False]
+
+    def validateAccess(self, profile):
+        """password, password_command and host of a profile"""
+        errors = []
+        if "password_command" in profile and isinstance(profile["password_command"], str) is False:
+            errors.append("password_command: must be a command")
+        if not profile.get("password") and not profile.get("password_command"):
+            errors.append("password: a password or a password_command is needed")
+        if "host" in profile and (isinstance(profile["host"], str) is False or profile["host"].strip() == ""):
+            errors.append("host: must be a host name")
+        return errors
+
+    def blockValidators(self):
+        """block of a profile -> function checking it, returning a list of error messages"""
+        return [
+            ("secondaries", self.validateSecondaries),
+            ("watch", ChangeJournal.validate),
+            ("compression_split", lambda block: CompressionSplit.validate(block, self.COMPRESSION_MODES)),
+            ("shards", ShardPlanner.validate),
+            ("hooks", Hooks.validate),
+            ("streams", StreamSources.validate),
+            ("resources", ResourceBudget.validate),
+            ("throttle", LoadThrottle.validate),
+            ("check", CheckRotation.validate),
+            ("schedule", Schedule.validate),
+        ]
+
+    def validateSecondaries(self, secondaries):
+        """secondaries: a list of repositories with storage, optional password or password_command"""
+        if isinstance(secondaries, list) is False:
+            return ["secondaries: must be a list of repositories"]
+        errors = []
+        for index, secondary in enumerate(secondaries):
+            if isinstance(secondary, dict) is False or isinstance(secondary.get("storage"), str) is False:
+                errors.append(f"secondaries[{index}]: a storage is needed")
+                continue
+            for key in secondary:
+                if key not in ["storage", "password", "password_command"]:
+                    errors.append(f"secondaries[{index}].{key}: unknown setting")
+        return errors
+
+    def _isInt(self, value):
+        """int but not bool"""
+        return isinstance(value, int) and isinstance(value, bool) is False
+
     def getConfigFilePath(self):
         return self.configFile
 
@@ -85,6 +210,7 @@ class Configuration:
 
             with open(path, "w") as file:
                 yaml.dump(config_dict, file, sort_keys=False, default_flow_style=False)
+            Configuration._cache.pop(os.path.abspath(filepath), None)
 
         except Exception as e:
             self.logger.error(f"Error saving config: {str(e)}")
@@ -94,10 +220,34 @@ class Configuration:
         return self.load_yml()
 
     def load_yml(self):
-        """load the yml File"""
-        with open(self.configFile, "rt", encoding="utf-8") as f:
-            yml = yaml.safe_load(f.read())
-        return yml
+        """
+        load the yml File, it is parsed again only if its mtime or size changed
+        every caller gets its own copy and may change it
+        """
+        path = os.path.abspath(self.configFile)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        cached = Configuration._cache.get(path)
+        if cached is None or cached[0] != stamp:
+            with open(path, "rt", encoding="utf-8") as f:
+                yml = yaml.load(f.read(), Loader=self.Loader)
+            cached = (stamp, yml)
+            Configuration._cache[path] = cached
+        return copy.deepcopy(cached[1])
+
+    def getSettingsFilePath(self):
+        return os.path.join(os.path.dirname(os.path.abspath(self.configFile)), "settings.yml")
+
+    def load_settings(self):
+        """settings.yml, it is optional, missing keys use SETTINGS_DEFAULTS"""
+        settings = dict(self.SETTINGS_DEFAULTS)
+        try:
+            with open(self.getSettingsFilePath(), "rt", encoding="utf-8") as f:
+                settings.update(yaml.load(f.read(), Loader=self.Loader) or {})
+        except FileNotFoundError:
+            pass
+        return settings
 
     def appendConfigFile(self, new_dict):
         """append new dict to existing config file"""
@@ -0,0 +1,199 @@
+import heapq
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from libs.Orchestrator import Orchestrator
+from libs.Scheduler import Schedule
+
+
+class Daemon:
+    """
+    Runs the scheduled jobs of all profiles until it is stopped.
+    config.yml is read once and again when it changes. Due jobs wait in a priority queue
+    (backup before prune before check), at most `workers` jobs run at once and only one job per storage.
+    prune and check read a whole repository, storages on the same server or disk share a backend and
+    at most max_per_backend (or its entry in backend_limits) of them are pruned or checked at the same time.
+    """
+
+    PRIORITY = {"backup": 0, "prune": 1, "check": 2}
+    # operations which share a backend with at most perBackend others
+    BACKEND_LIMITED = ["prune", "check"]
+
+    def __init__(self, Configuration, runJob, stateFile, workers=2, tick=30, term=None, perBackend=1, backendLimits=None):
+        """
+        :param Configuration: Configuration of config.yml
+        :param runJob: function(profile_name, operation) -> bool, runs one job
+        :param stateFile: json file with the last runs, survives restarts
+        :param workers: jobs running at the same time
+        :param tick: seconds between two looks at the schedules
+        :param term: TerminalColors for messages
+        :param perBackend: prune and check jobs running at the same time on one backend
+        :param backendLimits: dict backend key -> jobs, overrides perBackend
+        """
+        self.Configuration = Configuration
+        self.runJob = runJob
+        self.stateFile = stateFile
+        self.workers = max(1, workers)
+        self.tick = tick
+        self.term = term
+        self.perBackend = max(1, perBackend)
+        self.backendLimits = backendLimits or {}
+
+        self.schedules = {}
+        self.storages = {}
+        self.backends = {}
+        self._configStamp = None
+        self._queue = []
+        self._seq = 0
+        self._running = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self.lastRuns = self._loadState()
+
+    def message(self, text, color="DEFAULT"):
+        text = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {text}"
+        if self.term is not None:
+            self.term.print(text, color)
+        else:
+            print(text)
+
+    def _loadState(self):
+        try:
+            with open(self.stateFile, encoding="utf-8") as fh:
+                return {key: datetime.fromisoformat(value) for key, value in json.load(fh).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _saveState(self):
+        os.makedirs(os.path.dirname(self.stateFile), exist_ok=True)
+        with open(self.stateFile, "w", encoding="utf-8") as fh:
+            json.dump({key: value.isoformat(timespec="seconds") for key, value in self.lastRuns.items()}, fh, indent=2)
+
+    def reloadConfig(self):
+        """read config.yml if it changed since the last time"""
+        stat = os.stat(self.Configuration.getConfigFilePath())
+        stamp = (stat.st_mtime, stat.st_size)
+        if stamp == self._configStamp:
+            return False
+
+        configDict = self.Configuration.load_yml() or {}
+        schedules = {}
+        storages = {}
+        backends = {}
+        for name, profile in configDict.items():
+            if not isinstance(profile, dict) or "schedule" not in profile:
+                continue
+            errors = Schedule.validate(profile["schedule"])
+            if len(errors) > 0:
+                self.message(f"Profile [{name}] ignored: {'; '.join(errors)}", "RED")
+                continue
+            schedules[name] = Schedule(profile["schedule"])
+            storages[name] = Orchestrator.storageKey(profile["storage"])
+            backends[name] = Orchestrator.backendKey(profile["storage"])
+
+        with self._lock:
+            self.schedules = schedules
+            self.storages = storages
+            self.backends = backends
+        self._configStamp = stamp
+        self.message(f"config.yml loaded, {len(schedules)} scheduled profiles", "YELLOW")
+        return True
+
+    def _key(self, profile_name, operation):
+        return f"{profile_name}:{operation}"
+
+    def enqueue(self, profile_name, operation):
+        """put a job into the queue, a job already waiting or running is not added twice"""
+        key = self._key(profile_name, operation)
+        with self._lock:
+            if key in self._running or any(job[2] == key for job in self._queue):
+                return False
+            self._seq += 1
+            heapq.heappush(self._queue, (self.PRIORITY[operation], self._seq, key, profile_name, operation))
+        self.message(f"queued {operation} [{profile_name}]")
+        return True
+
+    def checkSchedules(self, lastCheck, now):
+        """queue all jobs due since lastCheck"""
+        for name, schedule in list(self.schedules.items()):
+            for operation in schedule.rules:
+                if schedule.isDue(operation, self.lastRuns.get(self._key(name, operation)), lastCheck, now):
+                    self.enqueue(name, operation)
+
+    def getBackendLimit(self, backend):
+        return max(1, int(self.backendLimits.get(backend, self.perBackend)))
+
+    def _isFree(self, name, operation):
+        """no job runs on the storage of the profile, and its backend is below the limit for prune and check"""
+        if self.storages[name] in {self.storages.get(running) for running in self._running.values()}:
+            return False
+        if operation not in self.BACKEND_LIMITED:
+            return True
+        backend = self.backends[name]
+        running = [key for key, other in self._running.items() if key.rsplit(":", 1)[1] in self.BACKEND_LIMITED and self.backends.get(other) == backend]
+        return len(running) < self.getBackendLimit(backend)
+
+    def dispatch(self, now):
+        """start waiting jobs, highest priority first, if a worker, their storage and their backend are free"""
+        with self._lock:
+            waiting = []
+            while self._queue and len(self._running) < self.workers:
+                job = heapq.heappop(self._queue)
+                priority, seq, key, name, operation = job
+                if name not in self.schedules:
+                    continue  # profile removed from config.yml
+                if self._isFree(name, operation) is False or self.schedules[name].inWindow(now) is False:
+                    waiting.append(job)
+                    continue
+                self._running[key] = name
+                threading.Thread(target=self._work, args=(key, name, operation), daemon=True).start()
+            for job in waiting:
+                heapq.heappush(self._queue, job)
+
+    def _work(self, key, profile_name, operation):
+        self.message(f"start {operation} [{profile_name}]")
+        start = time.monotonic()
+        try:
+            ok = self.runJob(profile_name, operation) is True
+        except SystemExit:
+            ok = False
+        except Exception as e:
+            self.message(f"{operation} [{profile_name}]: {e}", "RED")
+            ok = False
+        self.message(f"{'done' if ok else 'FAILED'} {operation} [{profile_name}] {round(time.monotonic() - start)}s", "DEFAULT" if ok else "RED")
+
+        with self._lock:
+            self.lastRuns[key] = datetime.now()
+            self._saveState()
+            del self._running[key]
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def run(self):
+        """main loop, returns after stop() or Ctrl+C when all running jobs are finished"""
+        self.message(f"Daemon started, {self.workers} workers", "YELLOW")
+        lastCheck = datetime.now()
+        try:
+            while not self._stop.is_set():
+                now = datetime.now()
+                try:
+                    self.reloadConfig()
+                except Exception as e:
+                    self.message(f"config.yml not loaded: {e}", "RED")
+                self.checkSchedules(lastCheck, now)
+                lastCheck = now
+                self.dispatch(now)
+                self._wakeup.wait(self.tick)
+                self._wakeup.clear()
+        except KeyboardInterrupt:
+            pass
+
+        self.message("Daemon stopping, waiting for running jobs ...", "YELLOW")
+        while len(self._running) > 0:
+            time.sleep(1)
@@ -1,4 +1,12 @@
 import requests
+import bz2
+import hashlib
+import json
+import re
+import platform
+import shutil
+import stat
+import time
 import zipfile
 import os
 from enum import Enum
@@ -19,45 +27,141 @@ class Architecture(Enum):
     ARM = "arm"
     I386 = "386"
 
+    @staticmethod
+    def current():
+        """architecture of this machine"""
+        machine = platform.machine().lower()
+        if machine in ("aarch64", "arm64"):
+            return Architecture.ARM64
+        if machine.startswith("arm"):
+            return Architecture.ARM
+        if machine in ("i386", "i686", "x86"):
+            return Architecture.I386
+        return Architecture.AMD64
+
 
 class GitHub:
 
-    def __init__(self, repo_owner, repo_name):
+    BLOCK_SIZE = 1024 * 1024  # 1 MiB
+    RETRIES = 5
+    CHECKSUM_ASSET = "SHA256SUMS"
+
+    def __init__(self, repo_owner, repo_name, api_url="https://api.github.com", cache_dir=None, ttl=3600):
         """
         :param repo_owner (str): Owner of the repository
         :param repo_name (str): Name of the repository
+        :param api_url (str): GitHub API, may point to a local stand-in server
+        :param cache_dir (str, optional): release metadata is cached here
+        :param ttl (int): seconds a cached release is used without asking GitHub
         """
         self.repo_owner = repo_owner
         self.repo_name = repo_name
+        self.api_url = api_url.rstrip("/")
+        self.cache_dir = cache_dir
+        self.ttl = ttl
         self.ReleaseInfo = {}
 
-    def get_latest_release_info(self):
+    @staticmethod
+    def tag(version):
+        """0.17.3 -> v0.17.3"""
+        return version if version.startswith("v") else f"v{version}"
+
+    def _cache_file(self, release):
+        return os.path.join(self.cache_dir, f"release-{self.repo_owner}-{self.repo_name}-{release}.json")
+
+    def _read_cache(self, release):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._cache_file(release), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, release, cached):
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{self._cache_file(release)}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(cached, fh)
+        os.replace(tmp, self._cache_file(release))
+
+    def get_latest_release_info(self, version: Optional[str] = None):
         """
         Get latest release with download URLs for different platforms
+        With a cache_dir the answer is kept for ttl seconds, after that it is revalidated with its ETag,
+        an unchanged release (304) does not count against the rate limit. If GitHub can't be reached,
+        the cached release is used.
+        :param version (str, optional): a pinned release, e.g. 0.17.3, instead of the latest one
         """
-        url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/releases/latest"
+        release = "latest" if version is None else self.tag(version)
+        path = "releases/latest" if version is None else f"releases/tags/{release}"
+        url = f"{self.api_url}/repos/{self.repo_owner}/{self.repo_name}/{path}"
         headers = {"Accept": "application/vnd.github.v3+json"}
 
+        cached = self._read_cache(release)
+        if cached is not None and time.time() - cached["fetched"] < self.ttl:
+            return self._set_release(cached["data"])
+        if cached is not None and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+
         try:
             response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
+            if response.status_code == 304 and cached is not None:
+                data = cached["data"]
+            else:
+                response.raise_for_status()
+                data = response.json()
+            self._write_cache(release, {"etag": response.headers.get("ETag"), "fetched": time.time(), "data": data})
+            return self._set_release(data)
 
-            data = response.json()
-            downloads = {}
+        except requests.exceptions.RequestException as e:
+            print(f"Error: {e}")
+            if cached is not None:
+                print("Using the cached release information ...")
+                return self._set_release(cached["data"])
+            return None
 
-            # Process assets to get download URLs
-            for asset in data["assets"]:
-                name = asset["name"]
-                download_url = asset["browser_download_url"]
-                downloads[name] = download_url
+    def _set_release(self, data):
+        """ReleaseInfo from the API answer"""
+        downloads = {}
 
-            self.ReleaseInfo = {"version": data["tag_name"], "url": data["html_url"], "published_at": data["published_at"], "downloads": downloads, "release_notes": data["body"]}
-            return self.ReleaseInfo
+        # Process assets to get download URLs
+        for asset in data["assets"]:
+            name = asset["name"]
+            download_url = asset["browser_download_url"]
+            downloads[name] = download_url
 
-        except requests.exceptions.RequestException as e:
+        self.ReleaseInfo = {"version": data["tag_name"], "url": data["html_url"], "published_at": data["published_at"], "downloads": downloads, "release_notes": data["body"]}
+        return self.ReleaseInfo
+
+    def get_mirror_release_info(self, mirror_dir: str, version: Optional[str] = None):
+        """
+        Release from a local mirror directory instead of GitHub, for hosts without internet
+        The mirror has one directory per release with the assets, as on GitHub:
+            <mirror_dir>/v0.17.3/restic_0.17.3_linux_amd64.bz2
+            <mirror_dir>/v0.17.3/SHA256SUMS
+        :param version (str, optional): a pinned release, else the newest one of the mirror
+        """
+        try:
+            releases = [entry.name for entry in os.scandir(mirror_dir) if entry.is_dir() and re.match(r"^v\d+\.\d+\.\d+$", entry.name)]
+        except OSError as e:
             print(f"Error: {e}")
             return None
 
+        if version is not None:
+            releases = [release for release in releases if release == self.tag(version)]
+        if len(releases) == 0:
+            print(f"Error: no release {'' if version is None else self.tag(version) + ' '}found in {mirror_dir}")
+            return None
+
+        release = max(releases, key=lambda r: tuple(int(v) for v in r[1:].split(".")))
+        release_dir = os.path.join(mirror_dir, release)
+        downloads = {entry.name: entry.path for entry in os.scandir(release_dir) if entry.is_file()}
+        self.ReleaseInfo = {"version": release, "url": release_dir, "published_at": "", "downloads": downloads, "release_notes": ""}
+        return self.ReleaseInfo
+
     def get_platform_download(self, platform: Platform, arch: Architecture = Architecture.AMD64) -> str | None:
         """
         Get download URL for specific platform and architecture
@@ -72,14 +176,16 @@ class GitHub:
 
         downloads = self.ReleaseInfo["downloads"]
 
-        # Match platform-specific file
-        platform_matches = {filename: url for filename, url in downloads.items() if platform.value in filename.lower() and arch.value in filename.lower()}
+        # Match platform-specific file, e.g. restic_0.17.3_linux_arm64.bz2, arm must not match arm64
+        platform_matches = {filename: url for filename, url in downloads.items() if f"_{platform.value}_{arch.value}." in filename.lower()}
 
         return next(iter(platform_matches.values()), None)
 
     def download_file(self, url: str, output_path: str, display_name: Optional[str] = None) -> bool:
         """
         Download a file from URL with progress bar
+        The data goes to <output_path>.part first. An interrupted download is resumed with a HTTP Range
+        request, on the next attempt or on the next call.
         :param url (str): Download URL
         :param output_path (str): Path where to save the file
         :param display_name (str, optional): Name to show in progress bar
@@ -87,52 +193,161 @@ class GitHub:
         Returns:
             bool: True if download successful, False otherwise
         """
-        try:
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        # Create directory if it doesn't exist
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        if os.path.isfile(url):
+            # from a mirror directory
+            shutil.copyfile(url, output_path)
+            return True
 
-            # Send request with stream enabled
-            print(f"\nDownloading from: {url}")
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
+        part_path = f"{output_path}.part"
+        desc = display_name or os.path.basename(output_path)
+        print(f"\nDownloading from: {url}")
 
-            # Get file size
-            total_size = int(response.headers.get("content-length", 0))
-            block_size = 1024  # 1 KB
+        for attempt in range(1, self.RETRIES + 1):
+            try:
+                if self._download_part(url, part_path, desc):
+                    os.replace(part_path, output_path)
+                    print(f"\nDownload completed: {output_path}")
+                    return True
+                return False
 
-            # Create progress bar
-            desc = display_name or os.path.basename(output_path)
-            with tqdm(total=total_size, unit="iB", unit_scale=True, unit_divisor=1024, desc=desc, bar_format="{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]") as pbar:
-                # Download and write file
-                with open(output_path, "wb") as f:
-                    for data in response.iter_content(block_size):
-                        size = f.write(data)
-                        pbar.update(size)
-
-            # Verify download size
-            if total_size != 0 and pbar.n != total_size:
-                print(f"ERROR: Downloaded size ({pbar.n}) does not match expected size ({total_size})")
+            except requests.exceptions.RequestException as e:
+                print(f"\nError downloading file (attempt {attempt}/{self.RETRIES}): {e}")
+                if attempt < self.RETRIES:
+                    time.sleep(min(2**attempt, 30))
+            except IOError as e:
+                print(f"\nError saving file: {e}")
                 return False
+            except Exception as e:
+                print(f"\nUnexpected error: {e}")
+                return False
+        return False
 
-            print(f"\nDownload completed: {output_path}")
-            return True
+    def _download_part(self, url, part_path, desc):
+        """download or resume into part_path, True if it is complete"""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
 
-        except requests.exceptions.RequestException as e:
-            print(f"\nError downloading file: {e}")
-            return False
-        except IOError as e:
-            print(f"\nError saving file: {e}")
+        with requests.get(url, stream=True, timeout=30, headers=headers) as response:
+            if response.status_code == 416:
+                # nothing left to load
+                return True
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                mode = "ab"
+                total_size = offset + int(response.headers.get("content-length", 0))
+            else:
+                # the server ignored the Range header, start again
+                mode = "wb"
+                offset = 0
+                total_size = int(response.headers.get("content-length", 0))
+
+            # Create progress bar
+            with tqdm(total=total_size, initial=offset, unit="iB", unit_scale=True, unit_divisor=1024, desc=desc, bar_format="{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]") as pbar:
+                with open(part_path, mode) as f:
+                    for data in response.iter_content(self.BLOCK_SIZE):
+                        pbar.update(f.write(data))
+
+        # Verify download size
+        size = os.path.getsize(part_path)
+        if total_size != 0 and size != total_size:
+            raise requests.exceptions.ConnectionError(f"Downloaded size ({size}) does not match expected size ({total_size})")
+        return True
+
+    def get_checksums(self) -> dict:
+        """
+        SHA256SUMS asset of the release
+        Returns:
+            dict: filename -> sha256, empty if the release has none
+        """
+        url = self.ReleaseInfo.get("downloads", {}).get(self.CHECKSUM_ASSET)
+        if url is None:
+            return {}
+        if os.path.isfile(url):
+            with open(url, encoding="utf-8") as fh:
+                text = fh.read()
+        else:
+            try:
+                response = requests.get(url, timeout=30)
+                response.raise_for_status()
+                text = response.text
+            except requests.exceptions.RequestException as e:
+                print(f"Error: {e}")
+                return {}
+
+        checksums = {}
+        for line in text.splitlines():
+            parts = line.split()
+            if len(parts) == 2:
+                checksums[parts[1].lstrip("*")] = parts[0].lower()
+        return checksums
+
+    def verify_file(self, path: str, sha256: str) -> bool:
+        """compare the SHA256 of a file"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for block in iter(lambda: fh.read(self.BLOCK_SIZE), b""):
+                digest.update(block)
+        return digest.hexdigest() == sha256.lower()
+
+    def download_verified(self, url: str, output_path: str) -> bool:
+        """
+        download a release asset and check it against SHA256SUMS of the release
+        Returns:
+            bool: True if the file was loaded and its checksum matches
+        """
+        checksums = self.get_checksums()
+        filename = os.path.basename(url)
+        if filename not in checksums:
+            print(f"\nError: no checksum for {filename} in {self.CHECKSUM_ASSET}")
             return False
-        except Exception as e:
-            print(f"\nUnexpected error: {e}")
+
+        if os.path.exists(output_path) is False or self.verify_file(output_path, checksums[filename]) is False:
+            if self.download_file(url, output_path) is False:
+                return False
+
+        if self.verify_file(output_path, checksums[filename]) is False:
+            print(f"\nError: checksum of {filename} does not match, file removed")
+            os.remove(output_path)
             return False
+        print(f"Checksum ok: {checksums[filename]}")
+        return True
+
+    def extract_binary(self, archive_path: str, extract_path: str, name: str = "restic") -> Optional[str]:
+        """
+        extract only the binary from a release asset (.zip on Windows, .bz2 on Linux/macOS)
+        :param name: the binary in a zip starts with it, a bz2 is unpacked to this name
+        Returns:
+            str | None: path of the binary
+        """
+        os.makedirs(extract_path, exist_ok=True)
+        if archive_path.lower().endswith(".bz2"):
+            target = os.path.join(extract_path, name)
+            try:
+                with bz2.open(archive_path, "rb") as src, open(f"{target}.tmp", "wb") as dst:
+                    shutil.copyfileobj(src, dst, self.BLOCK_SIZE)
+            except (OSError, EOFError) as e:
+                print(f"\nError extracting bz2: {e}")
+                return None
+            os.chmod(f"{target}.tmp", os.stat(f"{target}.tmp").st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+            os.replace(f"{target}.tmp", target)
+            return target
+
+        if self.unzip_file(archive_path, extract_path, member_filter=lambda member: os.path.basename(member).lower().startswith(name)) is False:
+            return None
+        with zipfile.ZipFile(archive_path, "r") as zip_ref:
+            members = [m for m in zip_ref.namelist() if os.path.basename(m).lower().startswith(name)]
+        return os.path.join(extract_path, members[0]) if members else None
 
-    def unzip_file(self, zip_path: str, extract_path: str, display_name: Optional[str] = None) -> bool:
+    def unzip_file(self, zip_path: str, extract_path: str, display_name: Optional[str] = None, member_filter=None) -> bool:
         """
         Unzip a file with progress bar
         :param zip_path (str): Path to zip file
         :param extract_path (str): Path where to extract files
         :param display_name (str, optional): Name to show in progress bar
+        :param member_filter (callable, optional): only members with member_filter(name) True are extracted
 
         Returns:
             bool: True if extraction successful, False otherwise
@@ -142,15 +357,16 @@ class GitHub:
             os.makedirs(extract_path, exist_ok=True)
 
             with zipfile.ZipFile(zip_path, "r") as zip_ref:
+                members = [file for file in zip_ref.filelist if member_filter is None or member_filter(file.filename)]
                 # Get total size for progress bar
-                total_size = sum(file.file_size for file in zip_ref.filelist)
+                total_size = sum(file.file_size for file in members)
                 extracted_size = 0
 
                 # Create progress bar
                 desc = display_name or os.path.basename(zip_path)
                 with tqdm(total=total_size, unit="iB", unit_scale=True, desc=f"Extracting {desc}", bar_format="{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt}") as pbar:
                     # Extract each file
-                    for file in zip_ref.filelist:
+                    for file in members:
                         zip_ref.extract(file, extract_path)
                         extracted_size += file.file_size
                         pbar.update(file.file_size)
@@ -0,0 +1,124 @@
+import os
+import signal
+import subprocess
+import time
+from libs.OSDetector import OSDetector
+
+
+class Hooks:
+    """
+    Commands run before (pre) and after (post) a backup.
+    Hooks with the same order run at the same time, a higher order waits for the lower ones.
+    A failing pre hook stops the remaining pre hooks and the backup, post hooks always run.
+    """
+
+    PHASES = ["pre", "post"]
+    DEFAULT_TIMEOUT = 300
+
+    def __init__(self, settings, log=print):
+        """
+        :param settings: hooks block of the profile
+        :param log: function writing a line to the output of the run
+        """
+        self.settings = settings or {}
+        self.log = log
+
+    @staticmethod
+    def validate(settings):
+        """
+        check a hooks block
+        :return: list of error messages
+        """
+        if isinstance(settings, dict) is False:
+            return ["hooks: must be a block with pre and post"]
+        errors = [f"hooks.{key}: unknown phase, pre or post" for key in settings if key not in Hooks.PHASES]
+        for phase in Hooks.PHASES:
+            hooks = settings.get(phase, [])
+            if isinstance(hooks, list) is False:
+                errors.append(f"hooks.{phase}: must be a list")
+                continue
+            for index, hook in enumerate(hooks):
+                errors += Hooks._validateHook(phase, index, hook)
+        return errors
+
+    @staticmethod
+    def _validateHook(phase, index, hook):
+        """one hook, a command string or a dict with command, timeout and order"""
+        if isinstance(hook, str):
+            return []
+        if isinstance(hook, dict) is False or isinstance(hook.get("command"), str) is False:
+            return [f"hooks.{phase}[{index}]: a command is needed"]
+        errors = []
+        for key in ["timeout", "order"]:
+            if key in hook and (isinstance(hook[key], int) is False or hook[key] < 0):
+                errors.append(f"hooks.{phase}[{index}].{key}: must be a number >= 0")
+        for key in hook:
+            if key not in ["command", "timeout", "order"]:
+                errors.append(f"hooks.{phase}[{index}].{key}: unknown setting")
+        return errors
+
+    def getHooks(self, phase):
+        """hooks of a phase as dicts, a plain string is a command with the defaults"""
+        hooks = []
+        for hook in self.settings.get(phase, []):
+            hook = {"command": hook} if isinstance(hook, str) else dict(hook)
+            hook.setdefault("timeout", self.DEFAULT_TIMEOUT)
+            hook.setdefault("order", 0)
+            hooks.append(hook)
+        return hooks
+
+    def run(self, phase, env=None):
+        """
+        run the hooks of a phase
+        :param env: extra environment variables for the hooks
+        :return: dict with ok, seconds of the phase and the results of the hooks (command, ok, returncode, seconds, timed_out)
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        start = time.monotonic()
+        hooks = self.getHooks(phase)
+        environment = dict(os.environ)
+        environment.update(env or {})
+
+        results = []
+        for order in sorted(set(hook["order"] for hook in hooks)):
+            group = [hook for hook in hooks if hook["order"] == order]
+            with ThreadPoolExecutor(max_workers=len(group)) as pool:
+                results += list(pool.map(lambda hook: self._runHook(hook, environment), group))
+            if phase == "pre" and any(result["ok"] is False for result in results):
+                break
+        return {
+            "ok": all(result["ok"] for result in results),
+            "seconds": round(time.monotonic() - start, 1),
+            "hooks": results,
+        }
+
+    def _runHook(self, hook, environment):
+        start = time.monotonic()
+        result = {"command": hook["command"], "ok": False, "returncode": None, "seconds": 0, "timed_out": False}
+        self.log(f"hook: {hook['command']}")
+        # own process group, so a timeout also ends what the hook started
+        proc = subprocess.Popen(
+            hook["command"],
+            shell=True,
+            env=environment,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=not OSDetector.is_windows(),
+        )
+        try:
+            output = proc.communicate(timeout=hook["timeout"] or None)[0]
+        except subprocess.TimeoutExpired:
+            result["timed_out"] = True
+            if OSDetector.is_windows():
+                proc.kill()
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+            output = proc.communicate()[0]
+        if output:
+            self.log(output.decode("utf-8", "ignore"))
+
+        result["returncode"] = proc.returncode
+        result["ok"] = proc.returncode == 0 and result["timed_out"] is False
+        result["seconds"] = round(time.monotonic() - start, 1)
+        return result
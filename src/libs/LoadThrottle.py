@@ -0,0 +1,242 @@
+import math
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from libs.ProcessTree import ProcessPause, ProcessTree
+
+
+class LoadThrottle:
+    """
+    Watches the host load while restic runs (Linux only).
+    When the load average per cpu or the IO pressure (/proc/pressure/io) gets too high, restic is
+    reniced (mode nice) or paused with SIGSTOP (mode pause). It gets its priority back or is continued
+    with SIGCONT as soon as the host is below resume_factor of the limits again.
+    The share of restic itself, its cpu time and the time it waited for IO, is subtracted from both values,
+    a backup does not throttle itself.
+    A pause lasts max_pause seconds at most, then restic runs for one interval, so it always makes progress.
+    Without delay accounting the IO share of restic is unknown, a nice throttle is then also released after max_pause.
+    """
+
+    DEFAULTS = {
+        "enabled": True,
+        "max_load": 1.0,
+        "max_io_pressure": 20,
+        "mode": "nice",
+        "interval": 5,
+        "resume_factor": 0.7,
+        "max_pause": 300,
+    }
+
+    MODES = ("nice", "pause")
+    PRESSURE_FILE = "/proc/pressure/io"
+    DELAYACCT_FILE = "/proc/sys/kernel/task_delayacct"
+    # time constants of the averages restic is compared with: loadavg 1 minute, pressure avg10
+    LOAD_WINDOW = 60
+    PRESSURE_WINDOW = 10
+    IONICE_CLASSES = {"none": 0, "realtime": 1, "best-effort": 2, "idle": 3}
+
+    def __init__(self, settings=None, pause=None):
+        """
+        :param settings: throttle dict of the profile, missing keys use DEFAULTS
+        :param pause: ProcessPause shared with the other watchers of the runner
+        """
+        self.settings = dict(self.DEFAULTS)
+        self.settings.update(settings or {})
+        self.pause = pause or ProcessPause()
+        self._stop = threading.Event()
+        self._thread = None
+        self.pid = None
+        self.throttled = False
+        self._since = 0
+        self._priorities = {}
+        self._ioPriorities = {}
+        self._ownLoad = 0
+        self._ownPressure = 0
+        self._sample = None
+        self._timeLimited = False
+        self.throttle_count = 0
+        self.throttled_seconds = 0
+
+    @staticmethod
+    def validate(settings):
+        """
+        check a throttle block
+        :return: list of error messages
+        """
+        if isinstance(settings, dict) is False:
+            return ["throttle: must be a block of settings"]
+        errors = [f"throttle.{key}: unknown setting" for key in settings if key not in LoadThrottle.DEFAULTS]
+        values = dict(LoadThrottle.DEFAULTS)
+        values.update(settings)
+        if isinstance(values["enabled"], bool) is False:
+            errors.append("throttle.enabled: must be true or false")
+        for key in ["max_load", "max_io_pressure", "interval", "max_pause"]:
+            if isinstance(values[key], (int, float)) is False or values[key] <= 0:
+                errors.append(f"throttle.{key}: must be a number > 0")
+        if isinstance(values["resume_factor"], (int, float)) is False or not 0 < values["resume_factor"] <= 1:
+            errors.append("throttle.resume_factor: must be a number between 0 and 1")
+        if values["mode"] not in LoadThrottle.MODES:
+            errors.append(f"throttle.mode: must be one of {', '.join(LoadThrottle.MODES)}")
+        return errors
+
+    def load(self):
+        """1 minute load average per cpu"""
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+
+    def ioPressure(self):
+        """share of time in % some tasks waited for IO in the last 10 seconds, None if unknown"""
+        try:
+            with open(self.PRESSURE_FILE) as fh:
+                for line in fh:
+                    if line.startswith("some"):
+                        return float(line.split()[1].split("=")[1])
+        except (OSError, IndexError, ValueError):
+            pass
+        return None
+
+    @classmethod
+    def delayAccounting(cls):
+        """does the kernel record the IO wait time of processes"""
+        try:
+            with open(cls.DELAYACCT_FILE) as fh:
+                return fh.read().strip() == "1"
+        except OSError:
+            return False
+
+    def measureOwn(self):
+        """
+        average the load and IO pressure restic itself causes, like the kernel averages the host values
+        the load share is its cpu time per cpu, the pressure share the time its threads waited for IO
+        """
+        now = (time.monotonic(), ProcessTree.treeCpu(self.pid), ProcessTree.treeBlkio(self.pid))
+        if self._sample is not None:
+            seconds = now[0] - self._sample[0]
+            if seconds > 0:
+                load = max(0, now[1] - self._sample[1]) / seconds / (os.cpu_count() or 1)
+                pressure = min(100, max(0, now[2] - self._sample[2]) / seconds * 100)
+                decay = math.exp(-seconds / self.LOAD_WINDOW)
+                self._ownLoad = self._ownLoad * decay + load * (1 - decay)
+                decay = math.exp(-seconds / self.PRESSURE_WINDOW)
+                self._ownPressure = self._ownPressure * decay + pressure * (1 - decay)
+        self._sample = now
+
+    def isBusy(self, factor=1.0):
+        """is the host above the limits without restic, scaled by factor"""
+        if self.load() - self._ownLoad > self.settings["max_load"] * factor:
+            return True
+        pressure = self.ioPressure()
+        return pressure is not None and pressure - self._ownPressure > self.settings["max_io_pressure"] * factor
+
+    def attach(self, pid):
+        """start watching the host while the process runs"""
+        if self.settings["enabled"] is False or ProcessTree.supported() is False:
+            return
+        self.pid = pid
+        self._ownLoad = 0
+        self._ownPressure = 0
+        self._sample = None
+        self._timeLimited = self.settings["mode"] == "pause" or self.delayAccounting() is False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def detach(self):
+        """stop watching"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.throttled:
+            self._release()
+
+    def _watch(self):
+        self.measureOwn()
+        while not self._stop.wait(self.settings["interval"]):
+            self.measureOwn()
+            if self.throttled:
+                self.throttled_seconds += self.settings["interval"]
+                self._since += self.settings["interval"]
+                # hysteresis, below resume_factor of the limits restic gets its speed back
+                if self.isBusy(self.settings["resume_factor"]) is False:
+                    self._release()
+                elif self._timeLimited and self._since >= self.settings["max_pause"]:
+                    self._release()
+            elif self.isBusy():
+                self._throttle()
+
+    def _throttle(self):
+        self.throttled = True
+        self._since = 0
+        self.throttle_count += 1
+        if self.settings["mode"] == "pause":
+            self.pause.hold(self.pid, self)
+            return
+
+        # nice and IO class belong to a thread on Linux, the Go worker threads of restic already run
+        tids = ProcessTree.treeThreads(self.pid)
+        for tid in tids:
+            try:
+                self._priorities[tid] = os.getpriority(os.PRIO_PROCESS, tid)
+                os.setpriority(os.PRIO_PROCESS, tid, 19)
+            except OSError:
+                pass
+        self._ioPriorities = self._getIonice(tids)
+        self._ionice(tids, "-c 3")
+
+    def _release(self):
+        self.throttled = False
+        if self.settings["mode"] == "pause":
+            self.pause.release(self)
+            return
+
+        for tid, priority in self._priorities.items():
+            try:
+                os.setpriority(os.PRIO_PROCESS, tid, priority)
+            except OSError:
+                # only root may raise the priority again
+                pass
+        # back to the IO class the resource budget gave restic
+        classes = {}
+        for tid, ioClass in self._ioPriorities.items():
+            classes.setdefault(ioClass, []).append(tid)
+        for ioClass, tids in classes.items():
+            self._ionice(tids, ioClass)
+        self._priorities = {}
+        self._ioPriorities = {}
+
+    def _getIonice(self, pids):
+        """
+        IO class of running threads
+        :return: dict thread id -> ionice options, e.g. -c 2 -n 4
+        """
+        ionice = shutil.which("ionice")
+        result = {}
+        if ionice is None:
+            return result
+        for pid in pids:
+            # e.g. "best-effort: prio 4", "idle", "none: prio 4"
+            output = subprocess.run([ionice, "-p", str(pid)], capture_output=True, text=True).stdout.strip()
+            match = re.fullmatch(r"([\w-]+)(?:: prio (\d))?", output)
+            if match is None or match.group(1) not in self.IONICE_CLASSES:
+                continue
+            ioClass = self.IONICE_CLASSES[match.group(1)]
+            result[pid] = f"-c {ioClass}" if ioClass in (0, 3) or match.group(2) is None else f"-c {ioClass} -n {match.group(2)}"
+        return result
+
+    def _ionice(self, pids, ioClass):
+        """set the IO class of running threads"""
+        ionice = shutil.which("ionice")
+        if ionice is None or len(pids) == 0:
+            return
+        subprocess.run(f"{ionice} {ioClass} -p {' '.join(str(pid) for pid in pids)}", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def stats(self):
+        """recorded values for a run report"""
+        return {
+            "throttle_mode": self.settings["mode"],
+            "throttled": self.throttle_count,
+            "throttled_seconds": self.throttled_seconds,
+        }
@@ -0,0 +1,133 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Orchestrator:
+    """
+    Runs jobs of several profiles concurrently with a limited number of workers.
+    Jobs of profiles sharing a storage run one after the other, one worker handles the whole storage.
+    If perBackend is set, storages on the same backend (server, bucket host, local disk) share at most perBackend workers.
+    """
+
+    REMOTE_PREFIXES = ["sftp", "rest", "s3", "b2", "azure", "gs", "swift", "rclone"]
+
+    def __init__(self, workers=4, perBackend=None, backendLimits=None):
+        """
+        :param workers: how many storages are worked on at the same time
+        :param perBackend: how many storages of one backend are worked on at the same time, None = no limit
+        :param backendLimits: dict backend key -> workers, overrides perBackend, only used with perBackend
+        """
+        self.workers = max(1, workers)
+        self.perBackend = None if perBackend is None else max(1, perBackend)
+        self.backendLimits = backendLimits or {}
+        self._queues = {}
+        self._lock = threading.Lock()
+        self.results = []
+
+    @staticmethod
+    def storageKey(storage):
+        """same storage, same key"""
+        return os.path.normcase(os.path.normpath(str(storage))).rstrip("/\\")
+
+    @staticmethod
+    def backendKey(storage):
+        """
+        storages on the same server or disk get the same key
+        e.g. sftp:user@host, s3:host, b2:bucket, local:<device>
+        """
+        storage = str(storage)
+        prefix = storage.split(":", 1)[0]
+        if prefix in Orchestrator.REMOTE_PREFIXES and ":" in storage:
+            rest = storage.split(":", 1)[1]
+            if "://" in rest:
+                return f"{prefix}:{rest.split('://', 1)[1].split('/', 1)[0]}"
+            return f"{prefix}:{rest.split(':', 1)[0].split('/', 1)[0]}"
+
+        # local storage, the device of the nearest existing directory
+        path = os.path.abspath(storage)
+        while os.path.exists(path) is False and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        try:
+            return f"local:{os.stat(path).st_dev}"
+        except OSError:
+            return "local"
+
+    def getBackendLimit(self, backend):
+        return max(1, int(self.backendLimits.get(backend, self.perBackend)))
+
+    def submit(self, profile_name, storage, func):
+        """
+        add a job
+        :param profile_name: name of the profile
+        :param storage: storage path of the profile
+        :param func: function without arguments, returns True on success
+        """
+        self._queues.setdefault(self.storageKey(storage), []).append((profile_name, storage, func))
+
+    def lanes(self):
+        """
+        the queues of the storages, grouped into lanes which run one after the other
+        every backend gets at most its limit of lanes, the storages are spread over them by number of jobs
+        without perBackend every storage is a lane of its own
+        """
+        if self.perBackend is None:
+            return list(self._queues.values())
+
+        backends = {}
+        for jobs in self._queues.values():
+            backends.setdefault(self.backendKey(jobs[0][1]), []).append(jobs)
+
+        lanes = []
+        for backend, queues in backends.items():
+            backendLanes = [[] for _ in range(min(len(queues), self.getBackendLimit(backend)))]
+            for jobs in sorted(queues, key=len, reverse=True):
+                min(backendLanes, key=len).extend(jobs)
+            lanes += backendLanes
+        return lanes
+
+    def _runQueue(self, jobs):
+        for profile_name, storage, func in jobs:
+            start = time.monotonic()
+            result = {
+                "profile": profile_name,
+                "storage": storage,
+                "backend": self.backendKey(storage),
+                "ok": False,
+                "seconds": 0,
+                "error": "",
+            }
+            try:
+                result["ok"] = func() is True
+            except SystemExit as e:
+                result["error"] = f"exit {e.code}"
+            except Exception as e:
+                result["error"] = str(e)
+            result["seconds"] = round(time.monotonic() - start, 1)
+            with self._lock:
+                self.results.append(result)
+
+    def run(self):
+        """
+        run all jobs, blocks until they are finished
+        :return: list of result dicts (profile, storage, backend, ok, seconds, error)
+        """
+        self.results = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for jobs in self.lanes():
+                pool.submit(self._runQueue, jobs)
+        self._queues = {}
+        return self.results
+
+    def printSummary(self, term, results=None):
+        """consolidated summary of all jobs"""
+        results = self.results if results is None else results
+        term.print("\nSummary", "YELLOW")
+        term.print("-------", "YELLOW")
+        width = max([len(r["profile"]) for r in results] + [7])
+        for r in sorted(results, key=lambda r: r["profile"]):
+            state = "ok" if r["ok"] else f"FAILED {r['error']}".strip()
+            term.print(f"{r['profile']:<{width}}  {r['seconds']:>8}s  {state}", "DEFAULT" if r["ok"] else "RED")
+        failed = len([r for r in results if r["ok"] is False])
+        term.print(f"\n{len(results) - failed} ok, {failed} failed", "YELLOW" if failed == 0 else "RED")
@@ -0,0 +1,63 @@
+import json
+import os
+from datetime import datetime
+
+
+class ParentTracker:
+    """
+    Remembers the last successful snapshot of a profile, the next backup uses it as --parent.
+    restic then compares against exactly this snapshot instead of searching one with the same paths,
+    a backup which nevertheless reads every file again is reported.
+    """
+
+    def __init__(self, stateFile):
+        """
+        :param stateFile: json file of the profile, e.g. bin/state/<profile>-parent.json
+        """
+        self.stateFile = stateFile
+
+    def get(self):
+        """id of the last snapshot, None if unknown"""
+        try:
+            with open(self.stateFile, encoding="utf-8") as fh:
+                return json.load(fh)["snapshot"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, snapshot):
+        """
+        remember a snapshot
+        :param snapshot: snapshot dict of restic snapshots --json
+        """
+        os.makedirs(os.path.dirname(self.stateFile), exist_ok=True)
+        tmp = f"{self.stateFile}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"snapshot": snapshot["id"], "time": snapshot.get("time"), "saved": datetime.now().isoformat(timespec="seconds")}, fh, indent=2)
+        os.replace(tmp, self.stateFile)
+
+    def clear(self):
+        """forget the parent, e.g. after a failed backup, restic chooses one itself next time"""
+        try:
+            os.remove(self.stateFile)
+        except OSError:
+            pass
+
+    @staticmethod
+    def analyse(snapshot, parent):
+        """
+        metrics of a new snapshot, the summary is written by restic 0.17 and newer
+        :param snapshot: snapshot dict of restic snapshots --json
+        :param parent: id of the parent given to restic, None if there was none
+        :return: dict for the run report
+        """
+        result = {"snapshot": snapshot["id"][:8], "parent": parent[:8] if parent else None}
+        summary = snapshot.get("summary")
+        if summary is None:
+            result["full_scan"] = None
+            return result
+
+        for key in ["files_new", "files_changed", "files_unmodified", "data_added"]:
+            result[key] = summary.get(key, 0)
+        # with a parent unchanged files are not read again, none of them means everything was read
+        result["full_scan"] = parent is not None and summary.get("files_unmodified", 0) == 0 and summary.get("files_new", 0) > 0
+        return result
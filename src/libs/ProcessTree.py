@@ -0,0 +1,175 @@
+import os
+import signal
+import threading
+
+
+class ProcessTree:
+    """A process and all of its children, read from /proc (Linux only)"""
+
+    @staticmethod
+    def supported():
+        """Returns True if /proc can be used"""
+        return os.path.exists("/proc/self/status")
+
+    @staticmethod
+    def children(pid):
+        """direct children of a process"""
+        taskDir = f"/proc/{pid}/task"
+        try:
+            tasks = os.listdir(taskDir)
+        except OSError:
+            return []
+
+        if os.path.exists(os.path.join(taskDir, tasks[0], "children")):
+            return ProcessTree._childrenOfTasks(taskDir, tasks)
+        # kernel without CONFIG_PROC_CHILDREN, look at the parent of every process
+        return ProcessTree._childrenByParent(pid)
+
+    @staticmethod
+    def _childrenOfTasks(taskDir, tasks):
+        """children listed in /proc/<pid>/task/<tid>/children"""
+        kids = []
+        for task in tasks:
+            try:
+                with open(os.path.join(taskDir, task, "children")) as fh:
+                    kids += [int(child) for child in fh.read().split()]
+            except OSError:
+                pass
+        return kids
+
+    @staticmethod
+    def _childrenByParent(pid):
+        """processes with pid as parent in /proc/<pid>/stat"""
+        kids = []
+        for entry in os.listdir("/proc"):
+            if entry.isdigit() is False:
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as fh:
+                    # the name in brackets may contain spaces
+                    fields = fh.read().rsplit(")", 1)[1].split()
+                if int(fields[1]) == pid:
+                    kids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+        return kids
+
+    @staticmethod
+    def tree(pid):
+        """the process and all its descendants"""
+        pids = [pid]
+        i = 0
+        while i < len(pids):
+            pids += ProcessTree.children(pids[i])
+            i += 1
+        return pids
+
+    @staticmethod
+    def threads(pid):
+        """thread ids of a process, the main thread has the pid"""
+        try:
+            return [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+        except (OSError, ValueError):
+            return []
+
+    @staticmethod
+    def treeThreads(pid):
+        """thread ids of the whole tree"""
+        return [tid for p in ProcessTree.tree(pid) for tid in ProcessTree.threads(p)]
+
+    @staticmethod
+    def rss(pid):
+        """resident memory of one process in bytes"""
+        try:
+            with open(f"/proc/{pid}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    @staticmethod
+    def treeRss(pid):
+        """resident memory of the whole tree in bytes"""
+        return sum(ProcessTree.rss(p) for p in ProcessTree.tree(pid))
+
+    @staticmethod
+    def cpu(pid):
+        """user + system cpu seconds of one process"""
+        try:
+            with open(f"/proc/{pid}/stat") as fh:
+                fields = fh.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, IndexError, ValueError):
+            return 0
+
+    @staticmethod
+    def treeCpu(pid):
+        """cpu seconds of the whole tree"""
+        return sum(ProcessTree.cpu(p) for p in ProcessTree.tree(pid))
+
+    @staticmethod
+    def blkioTicks(pid):
+        """
+        clock ticks all threads of a process waited for block IO, 0 without delay accounting
+        (kernel parameter delayacct or sysctl kernel.task_delayacct)
+        """
+        ticks = 0
+        try:
+            tasks = os.listdir(f"/proc/{pid}/task")
+        except OSError:
+            return 0
+        for task in tasks:
+            try:
+                with open(f"/proc/{pid}/task/{task}/stat") as fh:
+                    ticks += int(fh.read().rsplit(")", 1)[1].split()[39])
+            except (OSError, IndexError, ValueError):
+                pass
+        return ticks
+
+    @staticmethod
+    def treeBlkio(pid):
+        """seconds the whole tree waited for block IO"""
+        return sum(ProcessTree.blkioTicks(p) for p in ProcessTree.tree(pid)) / os.sysconf("SC_CLK_TCK")
+
+    @staticmethod
+    def signal(pid, sig=signal.SIGTERM):
+        """send a signal to the whole tree, children first"""
+        for p in reversed(ProcessTree.tree(pid)):
+            try:
+                os.kill(p, sig)
+            except OSError:
+                pass
+
+
+class ProcessPause:
+    """
+    SIGSTOP and SIGCONT of a process tree, shared by the watchers of one runner (RssWatcher, LoadThrottle).
+    The tree is continued only when none of them holds it any more, one watcher can not undo the pause of another.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._holders = set()
+        self.pid = None
+
+    def hold(self, pid, holder):
+        """pause the tree for holder, it is stopped by the first one"""
+        with self._lock:
+            if len(self._holders) == 0:
+                ProcessTree.signal(pid, signal.SIGSTOP)
+                self.pid = pid
+            self._holders.add(holder)
+
+    def release(self, holder):
+        """holder does not need the pause any more, the tree continues if nobody else holds it"""
+        with self._lock:
+            if holder not in self._holders:
+                return
+            self._holders.discard(holder)
+            if len(self._holders) == 0:
+                ProcessTree.signal(self.pid, signal.SIGCONT)
+
+    def isHeld(self, holder):
+        return holder in self._holders
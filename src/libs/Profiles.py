@@ -1,9 +1,10 @@
-import questionary
+import hashlib
 import logging
 import os
+import re
 import sys
-from questionary.prompts.common import Separator
-from questionary import Style
+import tempfile
+import time
 
 from libs.TerminalColors import TerminalColors
 
@@ -19,50 +20,67 @@ class Profiles:
         "Q4": "DELETE a profile ...",
     }
 
-    custom_style_fancy = Style(
-        [
-            ("qmark", "fg:#00ff00 bold"),  # token in front of the question
-            ("question", "fg:#c0c0c0 bold"),  # question text
-            ("answer", "fg:#c0c0c0 bold"),  # submitted answer text behind the question
-            (
-                "pointer",
-                "fg:#00ff00 bold",
-            ),  # pointer used in select and checkbox prompts
-            (
-                "highlighted",
-                "fg:#00ff00 bold",
-            ),  # pointed-at choice in select and checkbox prompts
-            ("selected", "fg:#c0c0c0"),  # style for a selected item of a checkbox
-            ("separator", "fg:#c0c0c0"),  # separator in lists
-            (
-                "instruction",
-                "fg:#c0c0c0",
-            ),  # user instructions for select, rawselect, checkbox
-            ("text", "fg:#c0c0c0"),  # plain text
-            (
-                "disabled",
-                "fg:#858585 italic",
-            ),  # disabled choices for select and checkbox prompts
-        ]
-    )
-
-    def __init__(self, Configuration, includeFile, excludeFile, resticPwd):
+    # questionary is loaded on first use, backups run without it
+    custom_style_rules = [
+        ("qmark", "fg:#00ff00 bold"),  # token in front of the question
+        ("question", "fg:#c0c0c0 bold"),  # question text
+        ("answer", "fg:#c0c0c0 bold"),  # submitted answer text behind the question
+        (
+            "pointer",
+            "fg:#00ff00 bold",
+        ),  # pointer used in select and checkbox prompts
+        (
+            "highlighted",
+            "fg:#00ff00 bold",
+        ),  # pointed-at choice in select and checkbox prompts
+        ("selected", "fg:#c0c0c0"),  # style for a selected item of a checkbox
+        ("separator", "fg:#c0c0c0"),  # separator in lists
+        (
+            "instruction",
+            "fg:#c0c0c0",
+        ),  # user instructions for select, rawselect, checkbox
+        ("text", "fg:#c0c0c0"),  # plain text
+        (
+            "disabled",
+            "fg:#858585 italic",
+        ),  # disabled choices for select and checkbox prompts
+    ]
+
+    _style = None
+
+    @property
+    def custom_style_fancy(self):
+        """questionary Style, created on first use"""
+        if Profiles._style is None:
+            from questionary import Style
+
+            Profiles._style = Style(self.custom_style_rules)
+        return Profiles._style
+
+    def __init__(self, Configuration, workDir):
+        """
+        :param Configuration: the Configuration of config.yml
+        :param workDir: include, exclude and password files of a profile are written to workDir/<profile>
+        """
         self.logger = logging.getLogger(__name__)
         self.Configuration = Configuration
 
-        self.includeFile = includeFile
-        self.excludeFile = excludeFile
-        self.resticPwd = resticPwd
+        self.workDir = workDir
+        self.includeFile = None
+        self.excludeFile = None
+        self.resticPwd = None
 
         self.configDict = self.Configuration.load_yml()
         # actual config data
         self.config = None
+        self.profileName = None
 
         self.term = TerminalColors()
-        self.term.set_BackgroundColor("BACKGROUND")
 
     # questionary.select("Welche CSV Datei?", choices=flist, style=self.custom_style_fancy).ask()
     def confirm(self, msg):
+        import questionary
+
         response = questionary.confirm(
             msg,
             default=False,
@@ -74,6 +92,9 @@ class Profiles:
         return response
 
     def MainMenue(self):
+        import questionary
+        from questionary.prompts.common import Separator
+
         a = questionary.select(
             "Profiles Management:",
             choices=[
@@ -118,19 +139,116 @@ class Profiles:
         """load config for a profile an set variables"""
         self.config = self._loadProfile(profile_name)
         if self.config is not False:
+            self.profileName = profile_name
+            errors = self.Configuration.validateProfile(self.config)
+            if len(errors) > 0:
+                self.term.print(f"Profile [{profile_name}] has invalid settings in config.yml:", "RED")
+                for error in errors:
+                    self.term.print(f"  {error}", "RED")
+                sys.exit(-1)
+
             self.storagePath = os.path.normpath(self.config["storage"])
             self.createDir(self.storagePath)
+
             self.createPwdFile()
-            self.createIncludeExcludeFiles(self.includeFile, self.excludeFile)
+            self.createIncludeExcludeFiles()
             return self.config
         else:
             sys.exit(-1)
 
+    def writeWorkFile(self, kind, content, secret=False):
+        """
+        write a working file of the actual profile to workDir/<profile>/<kind>-<hash>
+        The name depends on the content, an existing file is never changed and not written again.
+        A secret is stored in workDir/<profile>/.<kind> and only written if its content changed.
+        A new file is written to a temporary name and renamed, so other runs never see half of it.
+        :param kind: include, exclude or pwd
+        :param content: text of the file
+        :param secret: only readable by the owner
+        :return: path of the file
+        """
+        profileDir = os.path.join(self.workDir, self.profileName)
+        if secret:
+            # a hash of a secret in the file name would give it away, compare the content instead
+            filename = os.path.normpath(os.path.join(profileDir, f".{kind}"))
+            if self._readFile(filename) == content:
+                return filename
+        else:
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+            filename = os.path.normpath(os.path.join(profileDir, f"{kind}-{digest}"))
+            if os.path.exists(filename):
+                try:
+                    # still in use, removeOldWorkFiles looks at the time of the last use
+                    os.utime(filename)
+                except OSError:
+                    pass
+                return filename
+
+        self.createDir(profileDir)
+        # a name of its own for every writer, threads of one process write at the same time
+        fd, tmp = tempfile.mkstemp(prefix=f".{kind}-", suffix=".tmp", dir=profileDir)
+        if secret is False:
+            os.chmod(tmp, 0o644)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(content)
+        os.replace(tmp, filename)
+        if secret is False:
+            self.removeOldWorkFiles(profileDir, kind, filename)
+        return filename
+
+    def _readFile(self, filename):
+        try:
+            with open(filename, encoding="utf-8") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def removeOldWorkFiles(self, profileDir, kind, keep, age=86400):
+        """remove older versions of a working file, not used for a day, a running restic may still read them"""
+        # exactly <kind>-<hash>, exclude must not match exclude-split-<hash>
+        pattern = re.compile(rf"{re.escape(kind)}-[0-9a-f]{{16}}")
+        for entry in os.scandir(profileDir):
+            if pattern.fullmatch(entry.name) and entry.path != keep and time.time() - entry.stat().st_mtime > age:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
     def createPwdFile(self):
-        """create a password file from config"""
-        fh = open(os.path.join("src", "bin", ".pwd"), "w")
-        fh.write(self.config["password"])
-        fh.close()
+        """create a password file from config, not needed with password_command"""
+        self.resticPwd = None
+        if self.config.get("password_command"):
+            return
+        self.resticPwd = self.writeWorkFile("pwd", self.config["password"], secret=True)
+
+    def getPasswordOption(self):
+        """restic option for the password of the actual profile"""
+        if self.config.get("password_command"):
+            return f'--password-command "{self.config["password_command"]}"'
+        return f'-p "{self.resticPwd}"'
+
+    def getFromPasswordOption(self):
+        """password of the actual profile as source of restic copy"""
+        if self.config.get("password_command"):
+            return f'--from-password-command "{self.config["password_command"]}"'
+        return f'--from-password-file "{self.resticPwd}"'
+
+    def getSecondaries(self):
+        """secondary repositories of the actual profile, new snapshots are copied to them after a backup"""
+        return self.config.get("secondaries", [])
+
+    def getSecondaryPasswordOption(self, index):
+        """restic option for the password of a secondary repository, the password of the profile if it has none"""
+        secondary = self.getSecondaries()[index]
+        if secondary.get("password_command"):
+            return f'--password-command "{secondary["password_command"]}"'
+        if secondary.get("password"):
+            return f'-p "{self.writeWorkFile(f"pwd-{index}", secondary["password"], secret=True)}"'
+        return self.getPasswordOption()
+
+    def getHost(self):
+        """host name of the snapshots of the actual profile, None = restic uses the name of the computer"""
+        return self.config.get("host")
 
     def getSnapshots(self):
         """get all profile names"""
@@ -144,6 +262,22 @@ class Profiles:
         data = dict(dict_items)
         return data["storage"]
 
+    def getOption(self, key):
+        """get a tuning option of the profile, or its default"""
+        value = self.config.get(key, self.Configuration.TUNING_DEFAULTS.get(key))
+        if key == "compression" and value is False:
+            # yaml reads an unquoted off as false
+            value = "off"
+        return value
+
+    def getBackend(self, storage=None):
+        """restic backend of the storage, e.g. local, sftp, s3, the storage of the profile if None"""
+        storage = str(self.getStoragePath() if storage is None else storage)
+        for backend in ["sftp", "rest", "s3", "b2", "azure", "gs", "swift", "rclone"]:
+            if storage.startswith(f"{backend}:"):
+                return backend
+        return "local"
+
     def setConfig(self, config):
         """set actual config data"""
         self.config = config
@@ -202,6 +336,8 @@ class Profiles:
 
     def createProfile(self):
         """create a new profile"""
+        import questionary
+
         self.term.print("Creating a new profil", "yellow")
         pname = questionary.text("Profile name?").ask()
 
@@ -218,6 +354,8 @@ class Profiles:
 
     def showProfiles_Infos(self):
         """select a profile and show infos about it"""
+        import questionary
+
         plist = []
         plist = self.getProfiles()
         pname = questionary.select("Which profile?", choices=plist, style=self.custom_style_fancy).ask()
@@ -239,6 +377,8 @@ class Profiles:
         self.term.print("-exit-", "YELLOW")
 
     def renameProfile(self):
+        import questionary
+
         plist = []
         plist = self.getProfiles()
         pname = questionary.select("Which profile to rename?", choices=plist, style=self.custom_style_fancy).ask()
@@ -254,6 +394,8 @@ class Profiles:
         return new_config, pname, new_name
 
     def deleteProfile(self):
+        import questionary
+
         plist = []
         plist = self.getProfiles()
         pname = questionary.select("Which profile to DELETE?", choices=plist, style=self.custom_style_fancy).ask()
@@ -264,17 +406,8 @@ class Profiles:
                 new_config[key] = data
         return new_config, pname
 
-    def createIncludeExcludeFiles(self, incFile, exFile):
-        """create include.txt and exclude.txt from Profile"""
+    def createIncludeExcludeFiles(self):
+        """create the include and exclude files from Profile"""
         # use actual config
-        dict_items = self.config.items()
-        data = dict(dict_items)
-        file = open(incFile, "w")
-        for item in data["include"]:
-            file.write(f"{item}\n")
-        file.close()
-
-        file = open(exFile, "w")
-        for item in data["exclude"]:
-            file.write(f"{item}\n")
-        file.close()
+        self.includeFile = self.writeWorkFile("include", "".join(f"{item}\n" for item in self.config["include"]))
+        self.excludeFile = self.writeWorkFile("exclude", "".join(f"{item}\n" for item in self.config["exclude"]))
@@ -0,0 +1,70 @@
+import re
+from datetime import datetime
+
+
+class ReplicaCheck:
+    """
+    Compares the snapshots of a repository with the ones of a secondary, only from the snapshot lists
+    (restic snapshots --json), no pack is opened.
+    A copied snapshot keeps the id of its source in original, tree, time and paths must be the same.
+    """
+
+    def __init__(self, snapshots, replicaSnapshots):
+        """
+        :param snapshots: snapshot dicts of the source repository
+        :param replicaSnapshots: snapshot dicts of the secondary
+        """
+        self.snapshots = snapshots
+        self.replicaSnapshots = replicaSnapshots
+
+    @staticmethod
+    def parseTime(value):
+        """restic writes nanoseconds, datetime knows microseconds"""
+        value = re.sub(r"(\.\d{6})\d+", r"\1", value)
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+    @staticmethod
+    def differences(snapshot, replica):
+        """fields of a snapshot which differ in its copy"""
+        fields = []
+        if snapshot.get("tree") != replica.get("tree"):
+            fields.append("tree")
+        if ReplicaCheck.parseTime(snapshot["time"]) != ReplicaCheck.parseTime(replica["time"]):
+            fields.append("time")
+        if sorted(snapshot.get("paths", [])) != sorted(replica.get("paths", [])):
+            fields.append("paths")
+        return fields
+
+    def compare(self):
+        """
+        :return: dict with missing, extra and differing snapshot ids and the lag of the secondary
+        """
+        replicas = {replica.get("original", replica["id"]): replica for replica in self.replicaSnapshots}
+        source = {snapshot["id"]: snapshot for snapshot in self.snapshots}
+
+        missing = [snapshot["id"] for snapshot in self.snapshots if snapshot["id"] not in replicas]
+        extra = [replica["id"] for original, replica in replicas.items() if original not in source]
+        differing = {}
+        for snapshot in self.snapshots:
+            if snapshot["id"] in replicas:
+                fields = self.differences(snapshot, replicas[snapshot["id"]])
+                if fields:
+                    differing[snapshot["id"][:8]] = fields
+
+        # lag: how far the newest copied snapshot is behind the newest one
+        lag = None
+        if self.snapshots:
+            newest = max(self.parseTime(snapshot["time"]) for snapshot in self.snapshots)
+            copied = [self.parseTime(snapshot["time"]) for snapshot in self.snapshots if snapshot["id"] in replicas]
+            if copied:
+                lag = round((newest - max(copied)).total_seconds() / 3600, 1)
+
+        return {
+            "ok": len(missing) == 0 and len(differing) == 0,
+            "snapshots": len(self.snapshots),
+            "replicated": len(self.snapshots) - len(missing),
+            "missing": [snapshot_id[:8] for snapshot_id in missing],
+            "extra": [snapshot_id[:8] for snapshot_id in extra],
+            "differing": differing,
+            "lag_hours": lag,
+        }
@@ -0,0 +1,96 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Replicator:
+    """
+    Copies the new snapshots of a profile to its secondary repositories with restic copy.
+    The secondaries are worked on in parallel, once each. A failed secondary is not retried here,
+    which would block the backup job, it is marked as deferred and copied to again later.
+    Which snapshots a secondary already has is taken from the cached snapshot lists,
+    restic copy only runs if there is something to copy.
+    """
+
+    DEFER = 30  # seconds at least between a failed copy and its retry
+
+    def __init__(self, restic, snapshotCache):
+        """
+        :param restic: Restic with the profile loaded
+        :param snapshotCache: SnapshotCache
+        """
+        self.restic = restic
+        self.profiles = restic.profiles
+        self.cache = snapshotCache
+
+    def initSecondary(self, storage, passwordOption):
+        """create a secondary repository with the chunker parameters of the profile repository, so data deduplicates"""
+        runner = self.restic.createRunner()
+        runner.runCmd_Silent(self.restic.createCmd("cat config", storage, passwordOption))
+        if runner.returncode == 0:
+            return True
+        self.restic.log(f"Initializing secondary repository {storage}")
+        runner = self.restic.createRunner()
+        runner.runCmd_Silent(self.restic.createCmd(f"init --copy-chunker-params {self.fromRepoOptions()}", storage, passwordOption))
+        self.restic.log(runner.getStdErr())
+        return runner.returncode == 0
+
+    def fromRepoOptions(self):
+        return f'--from-repo "{self.profiles.getStoragePath()}" {self.profiles.getFromPasswordOption()}'
+
+    def replicate(self, storages=None):
+        """
+        copy new snapshots of the profile to its secondaries
+        :param storages: only these secondaries, all if None
+        :return: dict storage -> result (ok, copied, present, deferred, seconds, error)
+        """
+        secondaries = [(index, secondary) for index, secondary in enumerate(self.profiles.getSecondaries()) if storages is None or secondary["storage"] in storages]
+        if len(secondaries) == 0 or self.restic.supports("copy_from_repo", "copy --from-repo") is False:
+            return {}
+
+        snapshots = self.restic.refreshSnapshots()
+        if snapshots is None:
+            return {secondary["storage"]: {"ok": False, "deferred": True, "error": "snapshots of the profile repository unknown"} for index, secondary in secondaries}
+        # profiles may share a storage, each one copies only its own snapshots
+        snapshots = [snapshot for snapshot in snapshots if self.restic.isOwnSnapshot(snapshot)]
+
+        with ThreadPoolExecutor(max_workers=len(secondaries)) as pool:
+            futures = {secondary["storage"]: pool.submit(self._replicateTo, index, snapshots) for index, secondary in secondaries}
+        return {storage: future.result() for storage, future in futures.items()}
+
+    def _replicateTo(self, index, snapshots):
+        storage = self.profiles.getSecondaries()[index]["storage"]
+        passwordOption = self.profiles.getSecondaryPasswordOption(index)
+        start = time.monotonic()
+        result = {"ok": False, "copied": 0, "present": 0, "deferred": False, "seconds": 0, "error": ""}
+        result.update(self._copy(storage, passwordOption, snapshots))
+        if result["ok"] is False:
+            result["deferred"] = True
+            self.restic.log(f"Copy to {storage} failed ({result['error']}), it is tried again later")
+        result["seconds"] = round(time.monotonic() - start, 1)
+        return result
+
+    def _copy(self, storage, passwordOption, snapshots):
+        """one attempt, :return: dict with ok, copied, present and error"""
+        present = self.cache.get(storage)
+        if present is None:
+            if self.initSecondary(storage, passwordOption) is False:
+                return {"error": "init failed"}
+            present = self.restic.refreshSnapshots(storage, passwordOption)
+            if present is None:
+                return {"error": "snapshots failed"}
+
+        # a copied snapshot keeps the id of its source in original
+        copied = set(snapshot.get("original", snapshot["id"]) for snapshot in present)
+        missing = [snapshot["id"] for snapshot in snapshots if snapshot["id"] not in copied]
+        if len(missing) == 0:
+            return {"ok": True, "present": len(snapshots)}
+
+        runner = self.restic.createRunner()
+        runner.runCmd_Silent(self.restic.createCmd(f"copy {' '.join(missing)} {self.fromRepoOptions()}", storage, passwordOption))
+        if runner.returncode == 0:
+            self.restic.refreshSnapshots(storage, passwordOption)
+            return {"ok": True, "copied": len(missing), "present": len(snapshots) - len(missing)}
+        # list again, a copy which failed halfway leaves some of the snapshots behind
+        self.cache.invalidate(storage)
+        self.restic.log(runner.getStdErr())
+        return {"present": len(snapshots) - len(missing), "error": f"copy failed with return code {runner.returncode}"}
@@ -0,0 +1,223 @@
+import os
+import shutil
+import signal
+import threading
+from libs.OSDetector import OSDetector
+from libs.ProcessTree import ProcessPause, ProcessTree
+
+
+class ResourceBudget:
+    """
+    CPU and memory limits for a restic child process, from the resources block of a profile.
+    Go runtime settings go into the environment, nice, CPU affinity and the IO class are set by
+    wrapping the command in nice, taskset and ionice. A preexec_fn is not safe while other threads run.
+    """
+
+    DEFAULTS = {
+        "gomaxprocs": 0,
+        "gomemlimit": "",
+        "gogc": 0,
+        "nice": 0,
+        "ionice_class": "",
+        "ionice_level": 4,
+        "cpu_affinity": [],
+        "rss_limit": 0,
+        "rss_action": "log",
+        "sample_interval": 2,
+    }
+
+    IONICE_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+    RSS_ACTIONS = ("log", "throttle", "abort")
+
+    def __init__(self, settings=None):
+        """
+        :param settings: resources dict of the profile, missing keys use DEFAULTS
+        """
+        self.settings = dict(self.DEFAULTS)
+        self.settings.update(settings or {})
+
+    @staticmethod
+    def validate(settings):
+        """
+        check a resources block
+        :return: list of error messages
+        """
+        errors = []
+        if isinstance(settings, dict) is False:
+            return ["resources: must be a block of settings"]
+        for key in settings:
+            if key not in ResourceBudget.DEFAULTS:
+                errors.append(f"resources.{key}: unknown setting")
+
+        values = dict(ResourceBudget.DEFAULTS)
+        values.update(settings)
+        errors += ResourceBudget._validateNumbers(values)
+        if values["ionice_class"] not in ("", *ResourceBudget.IONICE_CLASSES):
+            errors.append(f"resources.ionice_class: must be one of {', '.join(ResourceBudget.IONICE_CLASSES)}")
+        if isinstance(values["cpu_affinity"], list) is False or any(isinstance(cpu, int) is False for cpu in values["cpu_affinity"]):
+            errors.append("resources.cpu_affinity: must be a list of cpu numbers")
+        if values["rss_action"] not in ResourceBudget.RSS_ACTIONS:
+            errors.append(f"resources.rss_action: must be one of {', '.join(ResourceBudget.RSS_ACTIONS)}")
+        return errors
+
+    @staticmethod
+    def _validateNumbers(values):
+        """the number settings of a resources block, :return: list of error messages"""
+        errors = []
+        for key in ["gomaxprocs", "gogc", "rss_limit", "sample_interval"]:
+            if isinstance(values[key], int) is False or values[key] < 0:
+                errors.append(f"resources.{key}: must be a number >= 0")
+        for key, highest in [("nice", 19), ("ionice_level", 7)]:
+            if isinstance(values[key], int) is False or not 0 <= values[key] <= highest:
+                errors.append(f"resources.{key}: must be a number between 0 and {highest}")
+        return errors
+
+    def environment(self):
+        """environment for the child with the Go runtime settings"""
+        env = dict(os.environ)
+        if self.settings["gomaxprocs"] > 0:
+            env["GOMAXPROCS"] = str(self.settings["gomaxprocs"])
+        if self.settings["gomemlimit"]:
+            env["GOMEMLIMIT"] = str(self.settings["gomemlimit"])
+        if self.settings["gogc"] > 0:
+            env["GOGC"] = str(self.settings["gogc"])
+        return env
+
+    def wrapCommand(self, cmd):
+        """put nice, taskset and ionice in front of the command, each one only if it is installed"""
+        if OSDetector.is_windows():
+            return cmd
+        ionice = shutil.which("ionice") if OSDetector.is_linux() else None
+        if self.settings["ionice_class"] and ionice is not None:
+            ioClass = self.IONICE_CLASSES[self.settings["ionice_class"]]
+            level = "" if ioClass == 3 else f" -n {self.settings['ionice_level']}"
+            cmd = f"{ionice} -c {ioClass}{level} {cmd}"
+        taskset = shutil.which("taskset") if OSDetector.is_linux() else None
+        if len(self.settings["cpu_affinity"]) > 0 and taskset is not None:
+            cmd = f"{taskset} -c {','.join(str(cpu) for cpu in sorted(set(self.settings['cpu_affinity'])))} {cmd}"
+        nice = shutil.which("nice")
+        if self.settings["nice"] > 0 and nice is not None:
+            cmd = f"{nice} -n {self.settings['nice']} {cmd}"
+        return cmd
+
+    def createWatcher(self, pause=None):
+        """
+        a watcher sampling the memory of the child
+        :param pause: ProcessPause shared with the other watchers of the runner
+        """
+        return RssWatcher(self.settings["rss_limit"], self.settings["rss_action"], self.settings["sample_interval"], pause)
+
+
+class RssWatcher:
+    """
+    Samples the resident memory of a process tree while it runs.
+    If rss_limit (MiB) is exceeded, the action is log, throttle (pause the tree for an interval) or abort.
+    """
+
+    def __init__(self, limit=0, action="log", interval=2, pause=None):
+        self.limit = limit * 1024 * 1024
+        self.action = action
+        self.interval = max(interval, 1)
+        self._stop = threading.Event()
+        self._thread = None
+        self.pause = pause or ProcessPause()
+        self.pid = None
+        self.peak = 0
+        self.samples = 0
+        self.exceeded = 0
+        self.aborted = False
+
+    def attach(self, pid):
+        """start sampling a process"""
+        if ProcessTree.supported() is False:
+            return
+        self.pid = pid
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def detach(self):
+        """stop sampling"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._resume()
+
+    def _resume(self):
+        self.pause.release(self)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            rss = ProcessTree.treeRss(self.pid)
+            self.samples += 1
+            self.peak = max(self.peak, rss)
+            if self.limit == 0 or rss <= self.limit:
+                self._resume()
+                continue
+
+            self.exceeded += 1
+            if self.action == "log" and self.exceeded == 1:
+                print(f"Memory limit exceeded: {round(rss / 1024 / 1024)} MiB > {round(self.limit / 1024 / 1024)} MiB")
+            elif self.action == "throttle":
+                # alternate between running and paused while over the limit, this only slows restic down,
+                # a paused process keeps its memory
+                if self.pause.isHeld(self):
+                    self._resume()
+                else:
+                    self.pause.hold(self.pid, self)
+            elif self.action == "abort":
+                print(f"Memory limit exceeded: {round(rss / 1024 / 1024)} MiB, aborting ...")
+                self._resume()
+                ProcessTree.signal(self.pid, signal.SIGTERM)
+                # a tree paused by another watcher only ends when it is continued
+                ProcessTree.signal(self.pid, signal.SIGCONT)
+                self.aborted = True
+                return
+
+    def stats(self):
+        """recorded values for a run report"""
+        return {
+            "peak_rss_mib": round(self.peak / 1024 / 1024, 1),
+            "rss_samples": self.samples,
+            "rss_limit_exceeded": self.exceeded,
+            "rss_aborted": self.aborted,
+        }
+
+
+class CpuWatcher:
+    """
+    Samples the cpu time of a process tree while it runs, the last sample before it ends is kept.
+    Unlike getrusage it works for processes running at the same time.
+    """
+
+    def __init__(self, interval=1):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.pid = None
+        self.cpu = 0
+
+    def attach(self, pid):
+        """start sampling a process"""
+        if ProcessTree.supported() is False:
+            return
+        self.pid = pid
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def detach(self):
+        """stop sampling"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.cpu = max(self.cpu, ProcessTree.treeCpu(self.pid))
+
+    def stats(self):
+        """recorded values for a run report"""
+        return {"cpu_seconds": round(self.cpu, 1)}
@@ -0,0 +1,127 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+from libs.OSDetector import OSDetector
+
+
+class ResticBinary:
+    """
+    The restic binary with its version and features.
+    The record is cached in a json file and only renewed if the binary changed (path, mtime, size),
+    so `restic version` runs once per binary and not on every start.
+    """
+
+    # feature -> first restic version having it
+    FEATURES = {
+        "json": (0, 9, 0),
+        "files_from_raw": (0, 12, 0),
+        "compression": (0, 14, 0),
+        "pack_size": (0, 14, 0),
+        "read_concurrency": (0, 14, 0),
+        "copy_from_repo": (0, 14, 0),
+        "no_scan": (0, 15, 0),
+        "stdin_from_command": (0, 17, 0),
+    }
+
+    def __init__(self, binPath, cacheFile):
+        """
+        :param binPath: bin directory of the wrapper, searched first
+        :param cacheFile: json file for the record
+        """
+        self.binPath = binPath
+        self.cacheFile = cacheFile
+        self.record = None
+
+    def find(self):
+        """path of the binary, None if there is none"""
+        if OSDetector.is_windows():
+            try:
+                files = sorted(entry.path for entry in os.scandir(self.binPath) if entry.is_file() and entry.name.lower().endswith(".exe"))
+                restic = [path for path in files if os.path.basename(path).lower().startswith("restic")]
+                return os.path.normpath((restic or files)[0])
+            except (OSError, IndexError):
+                return None
+
+        local = os.path.join(self.binPath, "restic")
+        if os.path.isfile(local) and os.access(local, os.X_OK):
+            return local
+        return shutil.which("restic")
+
+    def _stamp(self, path):
+        stat = os.stat(path)
+        return {"path": path, "mtime": stat.st_mtime, "size": stat.st_size}
+
+    def _readCache(self):
+        try:
+            with open(self.cacheFile, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _writeCache(self, record):
+        os.makedirs(os.path.dirname(self.cacheFile), exist_ok=True)
+        tmp = f"{self.cacheFile}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(record, fh, indent=2)
+        os.replace(tmp, self.cacheFile)
+
+    @staticmethod
+    def parseVersion(text):
+        """'restic 0.16.4 compiled with go1.21.6 on linux/amd64' -> (0, 16, 4), None if unknown"""
+        match = re.search(r"restic (\d+)\.(\d+)\.(\d+)", text)
+        if match is None:
+            return None
+        return tuple(int(v) for v in match.groups())
+
+    def probe(self, path):
+        """run restic version and build a new record"""
+        record = self._stamp(path)
+        try:
+            proc = subprocess.run([path, "version"], capture_output=True, text=True, timeout=30)
+            version = self.parseVersion(proc.stdout)
+        except (OSError, subprocess.SubprocessError):
+            version = None
+
+        record["version"] = None if version is None else ".".join(str(v) for v in version)
+        if version is None:
+            # a development build, assume it is recent
+            record["features"] = sorted(self.FEATURES)
+        else:
+            record["features"] = sorted(feature for feature, since in self.FEATURES.items() if version >= since)
+        return record
+
+    def load(self):
+        """
+        the record of the actual binary, from the cache if the binary did not change
+        :return: dict with path, mtime, size, version and features, None if there is no binary
+        """
+        if self.record is not None:
+            return self.record
+
+        path = self.find()
+        if path is None:
+            return None
+
+        cached = self._readCache()
+        stamp = self._stamp(path)
+        if cached is not None and all(cached.get(key) == value for key, value in stamp.items()):
+            self.record = cached
+        else:
+            self.record = self.probe(path)
+            self._writeCache(self.record)
+        return self.record
+
+    def getPath(self):
+        record = self.load()
+        return None if record is None else record["path"]
+
+    def getVersion(self):
+        record = self.load()
+        return None if record is None else record["version"]
+
+    def has(self, feature):
+        """does the binary support a feature of FEATURES"""
+        record = self.load()
+        return record is not None and feature in record["features"]
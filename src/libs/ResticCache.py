@@ -0,0 +1,103 @@
+import os
+import shutil
+
+
+class ResticCache:
+    """
+    A restic cache directory of one profile, bounded in size.
+    restic stores one sub directory per repository ID in it and touches it when the repository is used.
+    """
+
+    TAG_FILE = "CACHEDIR.TAG"
+
+    def __init__(self, cacheDir, maxSize=0):
+        """
+        :param cacheDir: path of the cache directory
+        :param maxSize: size limit in MiB, 0 = unlimited
+        """
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize * 1024 * 1024
+        self._before = {}
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+    def files(self):
+        """all cached files, relative path -> size"""
+        data = {}
+        for root, dirs, files in os.walk(self.cacheDir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    data[os.path.relpath(path, self.cacheDir)] = os.path.getsize(path)
+                except OSError:
+                    pass
+        return data
+
+    def size(self):
+        """size of the cache in bytes"""
+        return sum(self.files().values())
+
+    def repositories(self):
+        """repository caches, least recently used first"""
+        repos = [entry for entry in os.scandir(self.cacheDir) if entry.is_dir()]
+        return sorted(repos, key=lambda entry: entry.stat().st_mtime)
+
+    def startRun(self):
+        """remember the cached files before restic runs"""
+        self._before = self.files()
+
+    def finishRun(self):
+        """
+        compare the cache with the state of startRun, evict old data
+        :return: dict with kept_files, downloaded_files and sizes
+        kept files were in the cache before and after the run, whether restic read them or not is unknown
+        """
+        after = self.files()
+        downloaded = {path: size for path, size in after.items() if path not in self._before}
+        kept = len([path for path in after if path in self._before])
+
+        stats = {
+            "cache_dir": self.cacheDir,
+            "kept_files": kept,
+            "downloaded_files": len(downloaded),
+            "downloaded_mib": round(sum(downloaded.values()) / 1024 / 1024, 1),
+        }
+        stats["evicted_mib"] = round(self.evict() / 1024 / 1024, 1)
+        stats["size_mib"] = round(self.size() / 1024 / 1024, 1)
+        return stats
+
+    def evict(self):
+        """
+        least recently used cleanup until the cache fits into maxSize
+        whole repository caches go first, the newest one only loses its data packs
+        :return: bytes removed
+        """
+        if self.maxSize <= 0:
+            return 0
+
+        removed = 0
+        total = self.size()
+        repos = self.repositories()
+        while total > self.maxSize and len(repos) > 1:
+            repo = repos.pop(0)
+            repoSize = sum(os.path.getsize(os.path.join(root, name)) for root, dirs, files in os.walk(repo.path) for name in files)
+            shutil.rmtree(repo.path, ignore_errors=True)
+            removed += repoSize
+            total -= repoSize
+
+        if total > self.maxSize and len(repos) == 1:
+            # tree packs are fetched again when needed, index and snapshots are kept
+            dataDir = os.path.join(repos[0].path, "data")
+            packs = []
+            for root, dirs, files in os.walk(dataDir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    packs.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+            for used, packSize, path in sorted(packs):
+                if total <= self.maxSize:
+                    break
+                os.remove(path)
+                removed += packSize
+                total -= packSize
+
+        return removed
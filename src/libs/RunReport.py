@@ -0,0 +1,57 @@
+import json
+import os
+import time
+from datetime import datetime
+
+
+class RunReport:
+    """Collects the metrics of a run and prints them as a summary"""
+
+    def __init__(self, profile_name, operation):
+        """
+        :param profile_name: name of the profile
+        :param operation: e.g. backup, check
+        """
+        self.profile_name = profile_name
+        self.operation = operation
+        self.started = datetime.now()
+        self._start = time.monotonic()
+        self.sections = {}
+
+    def add(self, section, key, value):
+        """add a metric to a section of the report"""
+        self.sections.setdefault(section, {})[key] = value
+
+    def addSection(self, section, values: dict):
+        """add all metrics of a dict to a section"""
+        for key, value in values.items():
+            self.add(section, key, value)
+
+    def getDuration(self):
+        """seconds since the run was started"""
+        return round(time.monotonic() - self._start, 1)
+
+    def toDict(self):
+        return {
+            "profile": self.profile_name,
+            "operation": self.operation,
+            "started": self.started.isoformat(timespec="seconds"),
+            "duration": self.getDuration(),
+            **self.sections,
+        }
+
+    def print(self, term):
+        """print the report with TerminalColors"""
+        term.print(f"\nReport [{self.profile_name}] {self.operation}, {self.getDuration()}s", "YELLOW")
+        for section, values in self.sections.items():
+            term.print(f"  {section}:")
+            for key, value in values.items():
+                term.print(f"    {key}: {value}")
+
+    def save(self, directory):
+        """store the report as <profile>-<operation>.json, the last run of a profile and operation is kept"""
+        os.makedirs(directory, exist_ok=True)
+        filename = os.path.join(directory, f"{self.profile_name}-{self.operation}.json")
+        with open(filename, "w", encoding="utf-8") as fh:
+            json.dump(self.toDict(), fh, indent=2)
+        return filename
@@ -0,0 +1,148 @@
+import re
+from datetime import datetime, timedelta
+
+
+class CronExpression:
+    """
+    A cron expression with 5 fields: minute hour day month weekday
+    fields support *, numbers, ranges a-b, lists a,b and steps */n or a-b/n, weekday 0 and 7 are sunday
+    """
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expression}")
+        self.expression = expression
+        self.fields = [self._parseField(field, low, high) for field, (low, high) in zip(fields, self.RANGES)]
+        if 7 in self.fields[4]:
+            self.fields[4].add(0)
+        # day and weekday are or-ed if both are restricted, like cron does
+        self.anyDay = fields[2] == "*"
+        self.anyWeekday = fields[4] == "*"
+
+    def _parseField(self, field, low, high):
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step = part.split("/")
+                step = int(step)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = [int(v) for v in part.split("-")]
+            else:
+                start = end = int(part)
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"invalid cron field: {field}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches(self, dt: datetime):
+        minutes, hours, days, months, weekdays = self.fields
+        if dt.minute not in minutes or dt.hour not in hours or dt.month not in months:
+            return False
+        dayMatch = dt.day in days
+        weekdayMatch = (dt.isoweekday() % 7) in weekdays
+        if self.anyDay or self.anyWeekday:
+            return dayMatch and weekdayMatch
+        return dayMatch or weekdayMatch
+
+
+class Interval:
+    """every 30m, every 6h, every 7d"""
+
+    UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    PATTERN = re.compile(r"^every\s+(\d+)\s*([smhd])$")
+
+    def __init__(self, expression):
+        match = self.PATTERN.match(expression.strip().lower())
+        if match is None:
+            raise ValueError(f"invalid interval: {expression}")
+        self.seconds = int(match.group(1)) * self.UNITS[match.group(2)]
+        if self.seconds <= 0:
+            raise ValueError(f"invalid interval: {expression}")
+
+
+class Window:
+    """a daily time window like 22:00-06:00, may span midnight"""
+
+    def __init__(self, expression):
+        try:
+            start, end = expression.split("-")
+            self.start = datetime.strptime(start.strip(), "%H:%M").time()
+            self.end = datetime.strptime(end.strip(), "%H:%M").time()
+        except ValueError:
+            raise ValueError(f"invalid window: {expression}")
+
+    def contains(self, dt: datetime):
+        now = dt.time()
+        if self.start <= self.end:
+            return self.start <= now < self.end
+        return now >= self.start or now < self.end
+
+
+class Schedule:
+    """
+    The schedule block of a profile:
+        schedule:
+          backup: "0 1 * * *"    # cron expression
+          prune: "0 4 * * 0"
+          check: every 7d        # or an interval
+          window: "22:00-06:00"  # jobs start only inside the window
+    """
+
+    OPERATIONS = ("backup", "prune", "check")
+
+    def __init__(self, settings):
+        self.rules = {}
+        for operation in self.OPERATIONS:
+            if settings.get(operation):
+                self.rules[operation] = self.parseRule(str(settings[operation]))
+        self.window = Window(settings["window"]) if settings.get("window") else None
+
+    @staticmethod
+    def parseRule(expression):
+        if expression.strip().lower().startswith("every"):
+            return Interval(expression)
+        return CronExpression(expression)
+
+    @staticmethod
+    def validate(settings):
+        """
+        check a schedule block
+        :return: list of error messages
+        """
+        if isinstance(settings, dict) is False:
+            return ["schedule: must be a block of settings"]
+        errors = [f"schedule.{key}: unknown setting" for key in settings if key not in (*Schedule.OPERATIONS, "window")]
+        try:
+            Schedule(settings)
+        except (ValueError, TypeError) as e:
+            errors.append(f"schedule: {e}")
+        return errors
+
+    def isDue(self, operation, lastRun, lastCheck, now):
+        """
+        :param lastRun: datetime of the last run, None if it never ran
+        :param lastCheck: datetime of the last look at the schedule
+        :return: True if the operation should run now
+        """
+        rule = self.rules.get(operation)
+        if rule is None:
+            return False
+        if isinstance(rule, Interval):
+            return lastRun is None or (now - lastRun).total_seconds() >= rule.seconds
+
+        # every minute since the last check, at most one day back
+        minute = max(lastCheck, now - timedelta(days=1)).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        while minute <= now:
+            if rule.matches(minute) and (lastRun is None or lastRun < minute):
+                return True
+            minute += timedelta(minutes=1)
+        return False
+
+    def inWindow(self, now):
+        return self.window is None or self.window.contains(now)
@@ -0,0 +1,233 @@
+import glob
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+
+class ShardPlanner:
+    """
+    Splits the include list of a large profile into shards of about the same size, a run backs up
+    only some of them, the ones not backed up for the longest time, as many as fit into the window.
+    The entries of an include directory are the units which are distributed, the largest first
+    to the smallest shard. Sizes come from a scan, which is repeated every REPLAN_DAYS days or when the
+    include list changes, in between sizes are taken from restic. New entries get an extra shard of their own,
+    the paths of the other shards stay the same and restic still finds their parents.
+    After a new plan units may have moved to another shard, the snapshots of the old plan are kept
+    until every new shard was backed up once, then the shards which are gone are retired.
+    """
+
+    DEFAULTS = {
+        "count": 4,  # number of shards
+        "per_run": 1,  # shards backed up per run at most
+        "window": 0,  # minutes a run may take, 0 = no limit
+    }
+
+    REPLAN_DAYS = 30
+
+    def __init__(self, settings, stateFile):
+        """
+        :param settings: shards block of the profile
+        :param stateFile: json file of the plan, e.g. bin/state/<profile>-shards.json
+        """
+        self.settings = dict(self.DEFAULTS)
+        self.settings.update(settings or {})
+        self.stateFile = stateFile
+        self.state = self._load()
+
+    @staticmethod
+    def validate(settings):
+        """
+        check a shards block
+        :return: list of error messages
+        """
+        if isinstance(settings, dict) is False:
+            return ["shards: must be a block of settings"]
+        errors = [f"shards.{key}: unknown setting" for key in settings if key not in ShardPlanner.DEFAULTS]
+        for key in ["count", "per_run"]:
+            value = settings.get(key, ShardPlanner.DEFAULTS[key])
+            if isinstance(value, int) is False or value < 1:
+                errors.append(f"shards.{key}: must be a number >= 1")
+        window = settings.get("window", 0)
+        if isinstance(window, int) is False or window < 0:
+            errors.append("shards.window: must be a number of minutes >= 0")
+        return errors
+
+    def _load(self):
+        try:
+            with open(self.stateFile, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.stateFile), exist_ok=True)
+        tmp = f"{self.stateFile}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh, indent=2)
+        os.replace(tmp, self.stateFile)
+
+    @staticmethod
+    def units(patterns):
+        """entries of the include directories, a pattern with wildcards or a file is a unit of its own"""
+        units = []
+        for pattern in patterns:
+            pattern = str(pattern)
+            if glob.has_magic(pattern) or os.path.isdir(pattern) is False:
+                units.append(pattern)
+                continue
+            try:
+                units += sorted(entry.path for entry in os.scandir(pattern))
+            except OSError:
+                units.append(pattern)
+        return units
+
+    @staticmethod
+    def scanSize(unit):
+        """bytes of a unit, 0 if it can not be read"""
+        size = 0
+        for path in glob.glob(unit) if glob.has_magic(unit) else [unit]:
+            if os.path.isdir(path) and os.path.islink(path) is False:
+                for directory, dirs, files in os.walk(path):
+                    for name in files:
+                        try:
+                            size += os.lstat(os.path.join(directory, name)).st_size
+                        except OSError:
+                            pass
+            else:
+                try:
+                    size += os.lstat(path).st_size
+                except OSError:
+                    pass
+        return size
+
+    @staticmethod
+    def balance(sizes, count):
+        """largest unit first into the smallest shard, :return: list of count lists of units"""
+        shards = [[] for _ in range(count)]
+        totals = [0] * count
+        for unit in sorted(sizes, key=lambda unit: sizes[unit], reverse=True):
+            index = totals.index(min(totals))
+            shards[index].append(unit)
+            totals[index] += sizes[unit]
+        return shards
+
+    def plan(self, patterns):
+        """
+        the shards of the include patterns
+        :return: list of shards, each a list of units
+        """
+        units = self.units(patterns)
+        digest = hashlib.sha256("\n".join(str(pattern) for pattern in patterns).encode("utf-8")).hexdigest()[:16]
+        count = self.settings["count"]
+        if self.state.get("include") != digest or self.state.get("count") != count or time.time() - self.state.get("planned", 0) > self.REPLAN_DAYS * 86400:
+            sizes = {unit: self.scanSize(unit) for unit in units}
+            previous = self.state.get("shards") is not None
+            retired = set(self.state.get("retired", [])) | set(self.tags())
+            self.state = {
+                "include": digest,
+                "count": count,
+                "planned": time.time(),
+                # new shards have other paths, they count as not backed up
+                "shards": [{"units": shard, "size": sum(sizes[unit] for unit in shard), "last": None} for shard in self.balance(sizes, count)],
+                # the old snapshots hold the moved units until every new shard has run
+                "settled": previous is False,
+                "rate": self.state.get("rate"),
+            }
+            self.state["retired"] = sorted(retired - set(self.tags()))
+        else:
+            # entries gone since the plan, new ones go to an extra shard
+            known = set()
+            for shard in self.state["shards"]:
+                shard["units"] = [unit for unit in shard["units"] if unit in units]
+                known.update(shard["units"])
+            new = [unit for unit in units if unit not in known]
+            if new:
+                self.state["shards"].append({"units": new, "size": sum(self.scanSize(unit) for unit in new), "last": None})
+                # a tag of a former plan used again, its old snapshots are now kept by forget like the new ones
+                tag = self.tag(len(self.state["shards"]) - 1)
+                self.state["retired"] = [retired for retired in self.state.get("retired", []) if retired != tag]
+        self.save()
+        return [shard["units"] for shard in self.state["shards"]]
+
+    def nextShards(self):
+        """indexes of the shards for this run, never or longest not backed up first"""
+        shards = self.state["shards"]
+        order = sorted(range(len(shards)), key=lambda index: (shards[index]["last"] is not None, shards[index]["last"] or 0))
+        return [index for index in order if shards[index]["units"]][: self.settings["per_run"]]
+
+    def estimate(self, index):
+        """
+        seconds a shard will probably take, its last run or its size at the rate of the last shard
+        :return: seconds, None if unknown
+        """
+        shard = self.state["shards"][index]
+        if shard.get("seconds") is not None:
+            return shard["seconds"]
+        if self.state.get("rate"):
+            return shard["size"] / self.state["rate"]
+        return None
+
+    def fits(self, index, elapsed):
+        """
+        can the shard be finished inside the window
+        :param elapsed: seconds the run already took
+        """
+        if self.settings["window"] == 0:
+            return True
+        estimate = self.estimate(index)
+        return estimate is None or elapsed + estimate <= self.settings["window"] * 60
+
+    def tag(self, index):
+        """shard:i/N for the planned shards, shard:N+k for the extra shards of new entries"""
+        count = self.state["count"]
+        return f"shard:{index + 1}/{count}" if index < count else f"shard:{count}+{index - count + 1}"
+
+    def tags(self):
+        return [self.tag(index) for index in range(len(self.state.get("shards", [])))]
+
+    def finished(self, index, ok, size=None, seconds=None):
+        """
+        a shard was backed up
+        :param size: bytes restic processed, replaces the planned size
+        :param seconds: duration of the backup
+        """
+        shard = self.state["shards"][index]
+        if ok:
+            shard["last"] = time.time()
+            if size:
+                shard["size"] = size
+            if seconds:
+                shard["seconds"] = round(seconds, 1)
+                if size:
+                    self.state["rate"] = size / seconds
+        if self.settled() is False and all(shard["last"] is not None or not shard["units"] for shard in self.state["shards"]):
+            self.state["settled"] = True
+        self.save()
+
+    def settled(self):
+        """has every shard of the plan been backed up, before that nothing may be forgotten"""
+        return self.state.get("settled", True)
+
+    def retired(self):
+        """tags of shards of former plans, their snapshots are forgotten once the plan is settled"""
+        return self.state.get("retired", []) if self.settled() else []
+
+    def clearRetired(self):
+        self.state["retired"] = []
+        self.save()
+
+    def coverage(self):
+        """age of every shard and the oldest one"""
+        now = time.time()
+        shards = self.state.get("shards", [])
+        ages = [round((now - shard["last"]) / 86400, 1) if shard["last"] else None for shard in shards]
+        return {
+            "shards": len(shards),
+            "never_backed_up": len([age for age in ages if age is None]),
+            "oldest_shard_days": None if None in ages or len(ages) == 0 else max(ages),
+            "shard_days": {self.tag(index): age for index, age in enumerate(ages)},
+            "shard_mib": {self.tag(index): round(shard["size"] / 1048576) for index, shard in enumerate(shards)},
+            "planned": datetime.fromtimestamp(self.state["planned"]).isoformat(timespec="seconds") if "planned" in self.state else None,
+        }
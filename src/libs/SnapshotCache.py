@@ -0,0 +1,108 @@
+import json
+import os
+import sqlite3
+import time
+
+
+class SnapshotCache:
+    """
+    Snapshot lists of repositories (restic snapshots --json) in a SQLite database shared by all runs.
+    Snapshots are stored by repository id, storages pointing to the same repository share them.
+    The database runs in WAL mode, a backup can write while an interactive command reads.
+    """
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS repositories (storage TEXT PRIMARY KEY, repo_id TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS refreshed (repo_id TEXT PRIMARY KEY, updated REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS snapshots (repo_id TEXT NOT NULL, id TEXT NOT NULL, time TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (repo_id, id))",
+    ]
+
+    def __init__(self, filename):
+        """
+        :param filename: the database, e.g. bin/snapshots.db
+        """
+        self.filename = filename
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                db.execute(statement)
+
+    def _connect(self):
+        """a connection per call, the cache is used from several threads and processes"""
+        db = sqlite3.connect(self.filename, timeout=30)
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @staticmethod
+    def _key(storage):
+        return os.path.normpath(str(storage))
+
+    def repositoryId(self, storage):
+        """id of the repository of a storage, None if not known yet"""
+        db = self._connect()
+        try:
+            row = db.execute("SELECT repo_id FROM repositories WHERE storage = ?", (self._key(storage),)).fetchone()
+        finally:
+            db.close()
+        return row[0] if row else None
+
+    def setRepositoryId(self, storage, repo_id):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO repositories (storage, repo_id) VALUES (?, ?)", (self._key(storage), repo_id))
+
+    def ids(self, storage):
+        """ids of the cached snapshots of a storage"""
+        db = self._connect()
+        try:
+            rows = db.execute("SELECT s.id FROM snapshots s JOIN repositories r ON s.repo_id = r.repo_id WHERE r.storage = ?", (self._key(storage),)).fetchall()
+        finally:
+            db.close()
+        return set(row[0] for row in rows)
+
+    def get(self, storage):
+        """
+        the cached snapshots of a storage, oldest first
+        :return: list of snapshot dicts, None if the repository was never listed
+        """
+        db = self._connect()
+        try:
+            if self._updated(db, storage) is None:
+                return None
+            rows = db.execute(
+                "SELECT s.data FROM snapshots s JOIN repositories r ON s.repo_id = r.repo_id WHERE r.storage = ? ORDER BY s.time",
+                (self._key(storage),),
+            ).fetchall()
+        finally:
+            db.close()
+        return [json.loads(row[0]) for row in rows]
+
+    def _updated(self, db, storage):
+        row = db.execute("SELECT f.updated FROM refreshed f JOIN repositories r ON f.repo_id = r.repo_id WHERE r.storage = ?", (self._key(storage),)).fetchone()
+        return row[0] if row else None
+
+    def age(self, storage):
+        """seconds since the snapshots of a storage were listed, None if never"""
+        db = self._connect()
+        try:
+            updated = self._updated(db, storage)
+        finally:
+            db.close()
+        return None if updated is None else round(time.time() - updated)
+
+    def update(self, storage, added, removed):
+        """
+        change the snapshots of a storage, the repository id must be known
+        :param added: snapshot dicts new in the repository
+        :param removed: ids of snapshots gone from the repository
+        """
+        repo_id = self.repositoryId(storage)
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO snapshots (repo_id, id, time, data) VALUES (?, ?, ?, ?)", [(repo_id, snapshot["id"], snapshot["time"], json.dumps(snapshot)) for snapshot in added])
+            db.executemany("DELETE FROM snapshots WHERE repo_id = ? AND id = ?", [(repo_id, snapshot_id) for snapshot_id in removed])
+            db.execute("INSERT OR REPLACE INTO refreshed (repo_id, updated) VALUES (?, ?)", (repo_id, time.time()))
+
+    def invalidate(self, storage):
+        """the repository changed in an unknown way, list it again before it is used"""
+        with self._connect() as db:
+            db.execute("DELETE FROM refreshed WHERE repo_id IN (SELECT repo_id FROM repositories WHERE storage = ?)", (self._key(storage),))
@@ -0,0 +1,133 @@
+import re
+import shlex
+import subprocess
+import time
+from libs.OSDetector import OSDetector
+
+
+class StreamSources:
+    """
+    Backs up the output of commands, e.g. database dumps, every stream as its own snapshot.
+    restic 0.17 runs the command itself (--stdin-from-command) and creates no snapshot if it fails,
+    older versions get the output piped to --stdin, a snapshot of a failed command is forgotten again.
+    """
+
+    WORKERS = 4  # streams backed up at the same time
+
+    def __init__(self, restic):
+        """
+        :param restic: Restic with the profile loaded
+        """
+        self.restic = restic
+        self.streams = restic.profiles.config.get("streams", [])
+
+    @staticmethod
+    def validate(streams):
+        """
+        check the streams block of a profile
+        :return: list of error messages
+        """
+        if isinstance(streams, list) is False:
+            return ["streams: must be a list of name, command and filename"]
+        errors = []
+        names = set()
+        for index, stream in enumerate(streams):
+            if isinstance(stream, dict) is False:
+                errors.append(f"streams[{index}]: must be a block with name and command")
+                continue
+            name = stream.get("name")
+            if isinstance(name, str) is False or re.fullmatch(r"[\w.-]+", name) is None:
+                errors.append(f"streams[{index}].name: letters, digits, . _ and - only")
+            elif name in names:
+                errors.append(f"streams[{index}].name: {name} is used twice")
+            names.add(name)
+            if isinstance(stream.get("command"), str) is False or stream["command"].strip() == "":
+                errors.append(f"streams[{index}].command: a command is needed")
+            if "filename" in stream and isinstance(stream["filename"], str) is False:
+                errors.append(f"streams[{index}].filename: must be a file name")
+            for key in stream:
+                if key not in ["name", "command", "filename"]:
+                    errors.append(f"streams[{index}].{key}: unknown setting")
+        return errors
+
+    @staticmethod
+    def snapshotId(output):
+        """id of the snapshot restic saved, None if there is none"""
+        match = re.search(r"snapshot ([0-9a-f]{8,64}) saved", output)
+        return match.group(1) if match else None
+
+    def backupCmd(self, stream, option):
+        filename = stream.get("filename", stream["name"])
+        return self.restic.createCmd(f'backup {option} --stdin-filename "{filename}" --tag "stream:{stream["name"]}" {self.restic.backupOptions()}')
+
+    @staticmethod
+    def shellCmd(command):
+        """
+        restic starts the command without a shell, wrap it so pipes and redirects
+        belong to the stream and not to restic, like in the piped fallback
+        """
+        if OSDetector.is_windows():
+            return f"cmd /c {command}"
+        return f"sh -c {shlex.quote(command)}"
+
+    def run(self):
+        """
+        back up all streams
+        :return: dict name -> result (ok, snapshot, returncode, command_returncode, seconds)
+        """
+        if len(self.streams) == 0:
+            return {}
+        from concurrent.futures import ThreadPoolExecutor
+
+        fromCommand = self.restic.supports("stdin_from_command")
+        with ThreadPoolExecutor(max_workers=min(len(self.streams), self.WORKERS)) as pool:
+            futures = {stream["name"]: pool.submit(self._run if fromCommand else self._runPiped, stream) for stream in self.streams}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _run(self, stream):
+        """restic starts the command and checks its exit code"""
+        start = time.monotonic()
+        runner = self.restic.createRunner()
+        # the command goes last, everything after -- belongs to it
+        runner.runCmd_Silent(f"{self.backupCmd(stream, '--stdin-from-command')} -- {self.shellCmd(stream['command'])}")
+        self.restic.log(runner.getStdOut())
+        self.restic.log(runner.getStdErr())
+        return {
+            "ok": runner.returncode == 0,
+            "snapshot": self.snapshotId(runner.getStdOut()),
+            "returncode": runner.returncode,
+            "seconds": round(time.monotonic() - start, 1),
+        }
+
+    def _runPiped(self, stream):
+        """the command writes into a pipe to restic --stdin, both exit codes are checked"""
+        start = time.monotonic()
+        budget = self.restic.createBudget()
+        source = subprocess.Popen(stream["command"], shell=True, stdout=subprocess.PIPE)
+        backup = subprocess.Popen(
+            budget.wrapCommand(self.backupCmd(stream, "--stdin")),
+            shell=True,
+            stdin=source.stdout,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=budget.environment(),
+        )
+        # restic holds the pipe now, the command gets SIGPIPE if restic stops
+        source.stdout.close()
+        output = backup.communicate()[0].decode("utf-8", "ignore")
+        source.wait()
+        self.restic.log(output)
+
+        snapshot = self.snapshotId(output)
+        if source.returncode != 0 and snapshot is not None:
+            # the snapshot holds the output of a failed command, drop it
+            self.restic.log(f"{stream['command']} failed with return code {source.returncode}, forgetting snapshot {snapshot}")
+            self.restic.createRunner().runCmd_Silent(self.restic.createCmd(f"forget {snapshot}"))
+            snapshot = None
+        return {
+            "ok": source.returncode == 0 and backup.returncode == 0,
+            "snapshot": snapshot,
+            "returncode": backup.returncode,
+            "command_returncode": source.returncode,
+            "seconds": round(time.monotonic() - start, 1),
+        }
@@ -21,14 +21,13 @@ class TerminalColors:
         BACKGROUND = (253, 246, 227)
 
     def __init__(self, theme="Default"):
-        # Enable ANSI escape sequences in Windows
         # Enable ANSI escape sequences in Windows
         if os.name == "nt":
             import ctypes
 
             kernel32 = ctypes.windll.kernel32
             kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
-        os.system("")
+            os.system("")
 
         self.theme = getattr(self, theme)
         self.current_bg = None
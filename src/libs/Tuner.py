@@ -0,0 +1,241 @@
+import glob
+import os
+import random
+import shutil
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class Tuner:
+    """
+    Calibrates read_concurrency, pack_size and compression of a profile.
+    Short backups of a sample of the include set are written into scratch repositories
+    next to the storage of the profile, one option is swept after the other.
+    Every trial has to read the sample the same way: it is evicted from the page cache before each one
+    (posix_fadvise), where that is not possible a warm-up backup loads it into the cache for all of them.
+    """
+
+    READ_CONCURRENCY = [1, 2, 4, 8]
+    PACK_SIZES = [16, 32, 64, 128]
+    COMPRESSION = ["auto", "off", "max"]
+
+    # a compression mode may be this much slower than the fastest one, if it stores less
+    COMPRESSION_TOLERANCE = 0.9
+
+    def __init__(self, restic, sampleSize=256, maxFiles=20000):
+        """
+        :param restic: the Restic wrapper, the profile to tune must be loaded
+        :param sampleSize: MiB of data for a calibration backup
+        :param maxFiles: how many files are looked at to pick the sample
+        """
+        self.restic = restic
+        self.profiles = restic.profiles
+        self.term = restic.term
+        self.sampleSize = sampleSize * 1024 * 1024
+        self.maxFiles = maxFiles
+
+        self.workDir = os.path.join(restic.binPath, "tune")
+        self.sampleFile = os.path.join(self.workDir, f"{self.profiles.profileName}-sample.txt")
+        self.scratchRepo = f"{str(self.profiles.getStoragePath()).rstrip('/').rstrip(os.sep)}-tune"
+        self.sampleBytes = 0
+        self.sample = []
+        self.coldCache = False
+        self.results = []
+
+    def _candidates(self):
+        """files below the include entries of the profile"""
+        for entry in self.profiles.config["include"]:
+            if glob.has_magic(entry):
+                paths = glob.iglob(entry, recursive=True)
+            else:
+                paths = [entry]
+            for path in paths:
+                if os.path.isfile(path):
+                    yield path
+                elif os.path.isdir(path):
+                    for root, dirs, files in os.walk(path):
+                        for name in files:
+                            yield os.path.join(root, name)
+
+    def createSample(self):
+        """
+        pick random files up to sampleSize and write them to the sample file
+        :return: number of files in the sample
+        """
+        files = []
+        for path in self._candidates():
+            files.append(path)
+            if len(files) >= self.maxFiles:
+                break
+        random.shuffle(files)
+
+        sample = []
+        self.sampleBytes = 0
+        for path in files:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if self.sampleBytes + size > self.sampleSize and len(sample) > 0:
+                continue
+            sample.append(path)
+            self.sampleBytes += size
+            if self.sampleBytes >= self.sampleSize:
+                break
+
+        os.makedirs(self.workDir, exist_ok=True)
+        with open(self.sampleFile, "w", encoding="utf-8") as fh:
+            for path in sample:
+                fh.write(f"{os.path.abspath(path)}\n")
+        self.sample = sample
+        return len(sample)
+
+    def dropSampleCache(self):
+        """
+        evict the sample from the page cache, every trial reads it from disk
+        :return: False if the platform can not do it
+        """
+        if hasattr(os, "posix_fadvise") is False:
+            return False
+        for path in self.sample:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                return False
+            finally:
+                os.close(fd)
+        return True
+
+    def _isLocal(self):
+        return self.profiles.getBackend() == "local"
+
+    def _cpuTime(self):
+        """cpu seconds used by all finished child processes"""
+        if resource is None:
+            return None
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    def _repoSize(self, repo):
+        """stored bytes of a local repository"""
+        if self._isLocal() is False:
+            return None
+        return sum(os.path.getsize(os.path.join(root, name)) for root, dirs, files in os.walk(repo) for name in files)
+
+    def _run(self, cmd):
+        runner = self.restic.createRunner()
+        runner.runCmd_Silent(self.restic.modifyforOS(cmd))
+        return runner
+
+    def trial(self, index, read_concurrency, pack_size, compression):
+        """
+        one calibration backup into a fresh scratch repository
+        :return: dict with the settings and the measured values, None on errors
+        """
+        repo = f"{self.scratchRepo}{os.sep if self._isLocal() else '/'}{index}"
+        base = f'{os.path.normpath(self.restic.resticBin)} -r "{repo}" {self.profiles.getPasswordOption()} --no-cache'
+
+        runner = self._run(f"{base} init")
+        if "created restic repository" not in runner.getStdOut():
+            self.term.print(f"Could not create scratch repository {repo}", "RED")
+            self.term.print(runner.getStdErr().strip(), "RED")
+            return None
+
+        options = f"--read-concurrency {read_concurrency} --pack-size {pack_size} --compression {compression}"
+        if self.coldCache:
+            self.dropSampleCache()
+        cpu = self._cpuTime()
+        start = time.monotonic()
+        runner = self._run(f'{base} backup {options} --files-from-verbatim "{self.sampleFile}"')
+        duration = time.monotonic() - start
+        cpuUsed = None if cpu is None else round(self._cpuTime() - cpu, 1)
+
+        if "snapshot" not in runner.getStdOut():
+            self.term.print(f"Calibration backup failed: {runner.getStdErr().strip()}", "RED")
+            return None
+
+        result = {
+            "read_concurrency": read_concurrency,
+            "pack_size": pack_size,
+            "compression": compression,
+            "seconds": round(duration, 1),
+            "mib_per_s": round(self.sampleBytes / 1024 / 1024 / max(duration, 0.001), 1),
+            "cpu_s": cpuUsed,
+            "stored_mib": None,
+        }
+        size = self._repoSize(repo)
+        if size is not None:
+            result["stored_mib"] = round(size / 1024 / 1024, 1)
+            shutil.rmtree(repo, ignore_errors=True)
+
+        self.term.print(f"  concurrency={read_concurrency} pack={pack_size} compression={compression}: {result['mib_per_s']} MiB/s, cpu {cpuUsed}s, stored {result['stored_mib']} MiB")
+        self.results.append(result)
+        return result
+
+    def _best(self, results, key):
+        """fastest result, for compression the smallest one within the tolerance"""
+        results = [r for r in results if r is not None]
+        if len(results) == 0:
+            return None
+        fastest = max(results, key=lambda r: r["mib_per_s"])
+        if key != "compression" or any(r["stored_mib"] is None for r in results):
+            return fastest[key]
+        close = [r for r in results if r["mib_per_s"] >= fastest["mib_per_s"] * self.COMPRESSION_TOLERANCE]
+        return min(close, key=lambda r: r["stored_mib"])[key]
+
+    def tune(self):
+        """
+        sweep the options of the profile
+        :return: dict of the best settings, None if nothing could be measured
+        """
+        count = self.createSample()
+        if count == 0:
+            self.term.print("No files found in the include list of the profile ...", "RED")
+            return None
+        self.term.print(f"Sample: {count} files, {round(self.sampleBytes / 1024 / 1024, 1)} MiB")
+        self.term.print(f"Scratch repository: {self.scratchRepo}")
+
+        best = {
+            "read_concurrency": self.profiles.getOption("read_concurrency"),
+            "pack_size": self.profiles.getOption("pack_size"),
+            "compression": self.profiles.getOption("compression"),
+        }
+        if self.restic.supports("read_concurrency", "--read-concurrency") is False:
+            self.term.print("The restic binary is too old for tuning, 0.14 or newer is needed ...", "RED")
+            return None
+        sweeps = [("read_concurrency", self.READ_CONCURRENCY), ("pack_size", self.PACK_SIZES), ("compression", self.COMPRESSION)]
+        index = 0
+        # the first trial must not pay for reading the sample from disk alone
+        self.coldCache = self.dropSampleCache()
+        if self.coldCache is False:
+            self.term.print("\nWarm-up backup, the sample is read from the page cache in every trial ...", "YELLOW")
+            if self.trial(index, **best) is None:
+                return None
+            self.results.pop()
+            index += 1
+        for key, values in sweeps:
+            self.term.print(f"\nSweeping {key} ...", "YELLOW")
+            results = []
+            for value in values:
+                settings = dict(best)
+                settings[key] = value
+                results.append(self.trial(index, **settings))
+                index += 1
+            value = self._best(results, key)
+            if value is None:
+                return None
+            best[key] = value
+
+        if self._isLocal():
+            shutil.rmtree(self.scratchRepo, ignore_errors=True)
+        else:
+            self.term.print(f"Please remove the scratch repository {self.scratchRepo} manually", "YELLOW")
+        return best
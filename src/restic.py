@@ -1,17 +1,27 @@
-import atexit
 import click
+import glob
+import json
 import os
 import sys
-import questionary
 import re
+import time
 from datetime import datetime
 from libs.TerminalColors import TerminalColors
 from libs.Configuration import Configuration
+from libs.CheckRotation import CheckRotation
 from libs.CmdRunner import CmdRunner
 from libs.CmdRunner_Terminal import CmdRunner_Terminal
+from libs.Hooks import Hooks
+from libs.ParentTracker import ParentTracker
 from libs.Profiles import Profiles
 from libs.OSDetector import OSDetector
-from libs.GitHub import GitHub, Platform, Architecture
+from libs.ProcessTree import ProcessPause
+from libs.LoadThrottle import LoadThrottle
+from libs.ResourceBudget import ResourceBudget
+from libs.ResticBinary import ResticBinary
+from libs.ResticCache import ResticCache
+from libs.RunReport import RunReport
+from libs.StreamSources import StreamSources
 
 from pathlib import Path
 
@@ -20,11 +30,37 @@ class Restic:
 
     output_cache = []
 
-    def __init__(self):
+    # restic operations which write new packs to the repository
+    WRITE_OPERATIONS = ["backup", "copy", "prune", "forget", "rewrite", "repair", "recover"]
+
+    # tuning option -> operations it applies to (None = all), restic option, capability needed (name, help text)
+    # an option is only given if the profile sets another value than the default
+    TUNING_OPTIONS = [
+        ("compression", WRITE_OPERATIONS, "--compression {value}", ("compression", "--compression")),
+        ("pack_size", WRITE_OPERATIONS, "--pack-size {value}", ("pack_size", "--pack-size")),
+        ("read_concurrency", ["backup"], "--read-concurrency {value}", ("read_concurrency", "--read-concurrency")),
+        ("no_scan", ["backup"], "--no-scan", ("no_scan", "--no-scan")),
+        ("ignore_inode", ["backup"], "--ignore-inode", None),
+        ("ignore_ctime", ["backup"], "--ignore-ctime", None),
+        ("limit_upload", None, "--limit-upload {value}", None),
+        ("limit_download", None, "--limit-download {value}", None),
+        ("connections", None, "-o {backend}.connections={value}", None),
+    ]
+
+    # operations of runMany which share a backend with at most max_per_backend others
+    BACKEND_LIMITED = ["check", "stats"]
+
+    def __init__(self, quiet=False):
+        """
+        :param quiet: no screen setup, no spinners, command output goes to the log file if one is set
+        """
         self.rootDir = Path(__file__).parent
+        self.quiet = quiet
+        self.logFile = None
 
         self.term = TerminalColors()
-        self.term.set_BackgroundColor()
+        if self.quiet is False:
+            self.term.set_BackgroundColor()
 
         self.configFile = os.path.join(self.rootDir, "config.yml")
         self.Configuration = Configuration(self.configFile)
@@ -32,15 +68,15 @@ class Restic:
         # Dirs?
         self.binPath = os.path.join(self.rootDir, "bin")
         self.createDir(self.binPath)
+        self.reportsPath = os.path.join(self.binPath, "reports")
+        self.logsPath = os.path.join(self.binPath, "logs")
+        self.statePath = os.path.join(self.binPath, "state")
 
-        self.resticBin = self.getResticPath()
-        self.resticPwd = os.path.normpath(os.path.join(self.binPath, ".pwd"))
+        self.binary = ResticBinary(self.binPath, os.path.join(self.binPath, "restic-binary.json"))
+        self._resticBin = None
+        self._warned = set()
+        self.workPath = os.path.join(self.binPath, "profiles")
 
-        self.includeFile = os.path.normpath(os.path.join(self.binPath, "include.txt"))
-        self.excludeFile = os.path.normpath(os.path.join(self.binPath, "exclude.txt"))
-
-        # check for WIN Binary of restic
-        self.checkBinFileRestic()
         # Basic check
         self.checkForConfigFile()
 
@@ -50,21 +86,56 @@ class Restic:
         self.runner.add_stderr_listener(self.on_stderr)
         self.runner.add_completion_listener(self.on_completion)
 
+        # profiles are loaded by the commands, nothing is written before
         self.configDict = self.load_yml()
-        self.profiles = Profiles(self.Configuration, self.includeFile, self.excludeFile, self.resticPwd)
-        firstProfile = self.profiles.getFirstProfile()
-        # load first profile
-        self.config = self.profiles.loadProfile_and_setVariables(firstProfile)
-
-        # catch terminating Signal
-        atexit.register(self.exit_handler)
+        self.profiles = Profiles(self.Configuration, self.workPath)
 
         # Standard Informations
-        self._basicInfos()
+        if self.quiet is False:
+            self._basicInfos()
+
+    @property
+    def resticBin(self):
+        """restic binary, looked up on first use, on Windows it is downloaded if missing"""
+        if self._resticBin is None:
+            self.checkBinFileRestic()
+            # not found, leave it to the shell
+            self._resticBin = self.getResticPath() or "restic"
+        return self._resticBin
+
+    def loadProfile(self, profile_name):
+        """load a profile and apply its resource budget and watchers to the runner"""
+        config = self.profiles.loadProfile_and_setVariables(profile_name)
+        budget = self.createBudget()
+        self.runner.set_budget(budget)
+        self.runner.clear_process_watchers()
+        for watcher in self.createWatchers(budget):
+            self.runner.add_process_watcher(watcher)
+        return config
+
+    def createBudget(self):
+        """ResourceBudget of the actual profile"""
+        return ResourceBudget(self.profiles.config.get("resources"))
 
-    def exit_handler(self):
-        """do something on sys.exit()"""
-        pass
+    def createWatchers(self, budget):
+        """memory sampling and, if configured, load throttling for a child process, they share one pause"""
+        pause = ProcessPause()
+        watchers = [budget.createWatcher(pause)]
+        if "throttle" in self.profiles.config:
+            watchers.append(LoadThrottle(self.profiles.config["throttle"], pause))
+        return watchers
+
+    def createRunner(self, terminal=False):
+        """
+        a runner with the resource budget and the watchers of the actual profile
+        :param terminal: CmdRunner_Terminal with output to the terminal, else CmdRunner
+        """
+        runner = CmdRunner_Terminal(output_file=self.logFile) if terminal else CmdRunner()
+        budget = self.createBudget()
+        runner.set_budget(budget)
+        for watcher in self.createWatchers(budget):
+            runner.add_process_watcher(watcher)
+        return runner
 
     def checkForConfigFile(self):
         """Basic check for config file"""
@@ -101,15 +172,20 @@ class Restic:
         return data
 
     def getResticPath(self) -> str | None:
-        """get path to exe file"""
-        if OSDetector.is_windows():
-            try:
-                files = self.search_files_in_dir(self.binPath, [".exe"])
-                return os.path.normpath(os.path.join(self.rootDir, files[0]))
-            except Exception:
-                return None
-        if OSDetector.is_linux():
-            return "restic"
+        """get path to exe file, bin is searched first, on Linux the PATH after it"""
+        return self.binary.getPath()
+
+    def supports(self, feature, option=None):
+        """
+        does the restic binary support a feature, see ResticBinary.FEATURES
+        :param option: name of the option, a warning is shown once if it is not supported
+        """
+        if self.binary.has(feature):
+            return True
+        if option is not None and option not in self._warned:
+            self._warned.add(option)
+            self.term.print(f"restic {self.binary.getVersion()} does not support {option}, ignored ...", "RED")
+        return False
 
     def createEmptyConfigFile(self):
         """will create an Empty Config File"""
@@ -128,27 +204,114 @@ class Restic:
         self.term.print("config.yml")
         self.term.print("     snapshots: 4, how many snapshots will be stored\n")
         self.term.print("     password: <a strong secret, don't lose it!>\n")
+        self.term.print("     password_command: optional, a command printing the password, replaces password\n")
         self.term.print("     storage: absolute Path to the target Storage\n")
         self.term.print("     include: filename.txt of the include Patterns")
         self.term.print("              e.g: /data")
         self.term.print("                   /files/*.jpg\n")
-        self.term.print("     exclude: filename.txt of the exclude Patterns")
+        self.term.print("     exclude: filename.txt of the exclude Patterns\n")
+        self.term.print("     optional tuning, restic defaults if missing:")
+        self.term.print("     compression: auto | off | max | fastest | better")
+        self.term.print("     pack_size: 16, pack size in MiB (4 - 128)")
+        self.term.print("     read_concurrency: 2, files read in parallel by backup")
+        self.term.print("     limit_upload / limit_download: 0, KiB/s, 0 = unlimited")
+        self.term.print("     connections: 0, connections to the backend, 0 = restic default")
+        self.term.print("     no_scan / ignore_inode / ignore_ctime: false, backup switches")
+        self.term.print("     cache_dir: path of the restic cache, default bin/cache/<profile>")
+        self.term.print("     cache_max_size: 1024, MiB, least recently used repository caches are removed, 0 = unlimited")
+        self.term.print("     host: optional, host name of the snapshots, default the name of the computer")
+        self.term.print("     compression_split: optional, compressible / incompressible / entropy, two backups with their own compression")
+        self.term.print("     shards: optional, count / per_run, back up a large profile in parts")
+        self.term.print("     watch: optional, enabled / full_every / max_paths, backup only files changed since the last one")
+        self.term.print("     hooks: optional, pre / post lists of commands (command, timeout, order)")
+        self.term.print("     streams: optional, list of name + command (+ filename), the output is backed up")
+        self.term.print("     secondaries: optional, list of storage (+ password), new snapshots are copied there")
+        self.term.print("     check: optional, read_data_days / max_seconds / max_bytes, rotating --read-data-subset")
+
+    def setLogFile(self, filename):
+        """command output goes to filename instead of the terminal"""
+        self.createDir(os.path.dirname(filename))
+        self.logFile = filename
+
+    def log(self, line):
+        """print a line or append it to the log file"""
+        if self.logFile is None:
+            print(line.strip())
+        else:
+            with open(self.logFile, "a", encoding="utf-8") as fh:
+                fh.write(f"{line.rstrip()}\n")
+
+    def runWithSpinner(self, cmd, text):
+        """run with self.runner, no spinner in quiet mode"""
+        if self.quiet:
+            self.runner.runCmd_Silent(cmd)
+        else:
+            self.runner.runCmd_with_Spinner(cmd, text)
 
     # Callback Wrapper --------------
     def on_stdout(self, line):
-        print(line.strip())
+        self.log(line)
 
     def on_stderr(self, line):
-        print(line.strip())
+        self.log(line)
 
     def on_completion(self):
-        print("Command completed!")
+        self.log("Command completed!")
 
     # Callback Wrapper --------------
 
-    def createCmd(self, cmd):
-        """handle whitespaces and OS issues"""
-        cmd = f"{os.path.normpath(self.resticBin)} {cmd} -r {os.path.normpath(self.profiles.getStoragePath())} -p {os.path.normpath(self.resticPwd)}"
+    def tuningOptions(self, operation):
+        """
+        restic options of the profile, which apply to the operation
+        :param operation: restic command, e.g. backup
+        """
+        options = []
+        for key, operations, option, feature in self.TUNING_OPTIONS:
+            value = self.profiles.getOption(key)
+            if value == Configuration.TUNING_DEFAULTS[key] or (operations is not None and operation not in operations):
+                continue
+            if feature is not None and self.supports(*feature) is False:
+                continue
+            options.append(option.format(value=value, backend=self.profiles.getBackend()))
+        options.append(f'--cache-dir "{self.getCacheDir()}"')
+
+        return " ".join(options)
+
+    def getCacheDir(self):
+        """restic cache of the profile, bin/cache/<profile> if not set in config.yml"""
+        if self.profiles.getOption("cache_dir"):
+            return os.path.normpath(self.profiles.getOption("cache_dir"))
+        return os.path.normpath(os.path.join(self.binPath, "cache", self.profiles.profileName))
+
+    def startCache(self):
+        """open the cache of the actual profile and remember its content"""
+        cache = ResticCache(self.getCacheDir(), self.profiles.getOption("cache_max_size"))
+        cache.startRun()
+        return cache
+
+    def finishReport(self, report):
+        """print and store a run report"""
+        report.print(self.term)
+        report.save(self.reportsPath)
+
+    def createCmd(self, cmd, storage=None, passwordOption=None):
+        """
+        handle whitespaces and OS issues
+        :param storage: another repository than the one of the profile, e.g. a secondary
+        :param passwordOption: password option for storage
+        """
+        options = self.tuningOptions(cmd.split()[0])
+        if "--compression" in cmd:
+            # set by the caller, e.g. compression_split
+            options = re.sub(r"--compression \S+ ?", "", options).strip()
+        if options != "":
+            cmd = f"{cmd} {options}"
+        storage = self.profiles.getStoragePath() if storage is None else storage
+        passwordOption = self.profiles.getPasswordOption() if passwordOption is None else passwordOption
+        if self.profiles.getBackend(storage) == "local":
+            # normpath would break URLs like s3:https://host/bucket
+            storage = os.path.normpath(storage)
+        cmd = f"{os.path.normpath(self.resticBin)} {cmd} -r {storage} {passwordOption}"
         cmd = self.modifyforOS(cmd)
         return cmd
 
@@ -157,7 +320,6 @@ class Restic:
         if OSDetector.is_windows():
             return cmd
         if OSDetector.is_linux():
-            cmd = cmd.replace(f"{self.resticBin}", "restic")
             cmd = cmd.replace('"', "'")
         return cmd
 
@@ -194,12 +356,12 @@ class Restic:
         """Initialze the repository"""
         self.term.print(f"Initialze the repository [{profile_name}]")
 
-        config = self.profiles.loadProfile_and_setVariables(profile_name)
+        config = self.loadProfile(profile_name)
         if config is not False:
             # check Repo id initialized, but do not exit if not
             if self.testRepoInit() is False:
                 cmd = self.createCmd("init")
-                self.runner.runCmd_with_Spinner(cmd, "Initializing ")
+                self.runWithSpinner(cmd, "Initializing ")
                 self.term.print("Repository has been initialized ...", "YELLOW")
                 self.term.print(f"Path: {self.profiles.getStoragePath()}")
             else:
@@ -209,7 +371,7 @@ class Restic:
     def removeLocks(self):
         """Remove Lock files from Restic"""
         cmd = self.createCmd("unlock")
-        self.runner.runCmd_with_Spinner(cmd, "Unlock Repository ")
+        self.runWithSpinner(cmd, "Unlock Repository ")
         res = self.runner.getStdErr()
 
         if "Fatal: wrong password or no key found" in res:
@@ -221,80 +383,788 @@ class Restic:
         self.term.print("done ...", "YELLOW")
 
     def backup(self, profile_name="default"):
-        """do a restic backup"""
-        config = self.profiles.loadProfile_and_setVariables(profile_name)
+        """
+        do a restic backup, with the pre and post hooks of the profile around it
+        :return: True if restic finished the backup without errors
+        """
+        config = self.loadProfile(profile_name)
 
         if config is not False:
             self.term.print(f"Creating a backup [{profile_name}] with {self.profiles.getSnapshots()} snapshots")
-            if self.testRepoInit() is True:
-                # remove Lock
-                self.removeLocks()
+            report = RunReport(profile_name, "backup")
+            hooks = Hooks(config.get("hooks"), self.log)
+            env = {"RESTIC_PROFILE": profile_name, "RESTIC_REPOSITORY": str(self.profiles.getStoragePath())}
+
+            if "hooks" in config:
+                pre = hooks.run("pre", env)
+                report.add("hooks", "pre", pre)
+                if pre["ok"] is False:
+                    self.term.print("A pre hook failed, no backup ...", "RED")
+                    self.finishReport(report)
+                    return False
+
+            ok = self._backup(config, report)
+
+            if "hooks" in config:
+                env["RESTIC_BACKUP_OK"] = "1" if ok else "0"
+                post = hooks.run("post", env)
+                report.add("hooks", "post", post)
+                if post["ok"] is False:
+                    self.term.print("A post hook failed ...", "RED")
+                    ok = False
+            self.finishReport(report)
+            return ok
+        return False
+
+    def _backup(self, config, report):
+        """backup, streams, forget, prune and replication of the loaded profile"""
+        if self.testRepoInit() is False:
+            self.term.print("-exit-", "YELLOW")
+            return False
 
-                # backup
-                cmd = self.createCmd(f'backup --files-from "{os.path.normpath(self.includeFile)}" --exclude-file "{os.path.normpath(self.excludeFile)}"')
-                print(cmd)
-                runner = CmdRunner_Terminal()
-                runner.run_command(cmd)
+        cache = self.startCache()
 
-                self.term.print("done ...", "YELLOW")
+        # remove Lock
+        self.removeLocks()
 
-                # keep n snapshots
-                snapshots = config["snapshots"]
-                cmd = self.createCmd(f"forget --keep-last {snapshots}")
+        ok, runner = self.backupFiles(config, report)
 
-                self.runner.runCmd_with_Spinner(cmd, "Maintaince Snapshots  ")
-                self.term.print("done ...", "YELLOW")
+        # output of commands, every stream as its own snapshot
+        if "streams" in config:
+            self.term.print(f"Backing up {len(config['streams'])} streams")
+            streams = StreamSources(self).run()
+            for name, result in streams.items():
+                report.add("streams", name, result)
+                if result["ok"] is False:
+                    self.term.print(f"Stream {name} failed", "RED")
+            ok = ok and all(result["ok"] for result in streams.values())
 
-                # free space
-                cmd = self.createCmd("prune")
+        # keep n snapshots
+        cmd = self.forgetCmd(config)
+        if cmd is None:
+            self.term.print("New shard plan, snapshots are kept until every shard was backed up", "YELLOW")
+        else:
+            self.runWithSpinner(cmd, "Maintaince Snapshots  ")
+            self.term.print("done ...", "YELLOW")
+
+        # free space
+        cmd = self.createCmd("prune")
+
+        self.runner.runCmd(cmd, "Maintaince Snapshots  ")
+        self.term.print("done ...", "YELLOW")
+        self.refreshSnapshots()
+
+        if ok and self.profiles.getSecondaries():
+            report.addSection("replication", self.replicate())
+
+        if runner is not None:
+            report.add("backup", "returncode", runner.returncode)
+            report.addSection("resources", runner.getWatcherStats())
+        report.addSection("cache", cache.finishRun())
+        return ok
+
+    def backupFiles(self, config, report):
+        """
+        the file backup of the loaded profile, against its last full snapshot
+        with a watch block only the paths changed since the last backup, see ChangeJournal
+        :return: True on success, runner of the backup (None if nothing changed)
+        """
+        if "shards" in config:
+            return self.backupShards(config, report)
+        if "compression_split" in config and config["compression_split"].get("enabled", True) and self.supports("compression", "--compression"):
+            return self.backupSplit(config, report)
+
+        parents = ParentTracker(os.path.join(self.statePath, f"{self.profiles.profileName}-parent.json"))
+        parent = parents.get()
+        started = time.time()
+        journal, changes = self.planChanges(config, parent, report)
+        if changes is not None and len(changes) == 0:
+            self.term.print("Nothing changed since the last backup ...", "YELLOW")
+            journal.finished(True, False, started)
+            return True, None
+
+        options = self.backupOptions()
+        if parent is not None:
+            options += f" --parent {parent}"
+        if changes is None:
+            files = f'--files-from "{os.path.normpath(self.profiles.includeFile)}"'
+        else:
+            # a snapshot of the changed paths only, the last full snapshot stays the parent
+            report.add("watch", "paths", len(changes))
+            changesFile = self.profiles.writeWorkFile("changes", "".join(path + "\0" for path in changes))
+            files = f'--files-from-raw "{changesFile}" --tag "changes"'
+        cmd = self.createCmd(f'backup {files} --exclude-file "{os.path.normpath(self.profiles.excludeFile)}" {options}')
+        self.log(cmd)
+        runner = self.createRunner(terminal=True)
+        runner.run_command(cmd)
+
+        self.term.print("done ...", "YELLOW")
+        ok = runner.returncode == 0
+        if journal is not None:
+            journal.finished(ok, changes is None, started)
+        self.trackParent(parents, parent, ok, changes is None, report)
+        if ok and changes is None and journal is not None:
+            self.forgetChanges()
+        return ok, runner
+
+    def planChanges(self, config, parent, report):
+        """
+        the paths changed since the last backup, for a profile with a watch block
+        :return: ChangeJournal (None without watch block), list of paths (None for a full backup)
+        """
+        if self.isWatched(config) is False:
+            return None, None
+        from libs.ChangeJournal import ChangeJournal
+
+        journal = ChangeJournal(self.statePath, self.profiles.profileName, config["watch"])
+        changes, reason = journal.plan(parent)
+        report.add("watch", "mode", "full" if changes is None else "changes")
+        report.add("watch", "reason", reason)
+        return journal, changes
+
+    def trackParent(self, parents, parent, ok, full, report):
+        """
+        remember the snapshot of a full backup as the next parent
+        :param parents: ParentTracker of the profile
+        :param parent: snapshot id given as --parent, or None
+        :param full: False for a backup of the changed paths only, it never becomes a parent
+        """
+        if ok and full:
+            snapshot = self.latestSnapshot()
+            if snapshot is not None:
+                parents.set(snapshot)
+                report.addSection("parent", ParentTracker.analyse(snapshot, parent))
+                if report.sections["parent"]["full_scan"]:
+                    self.term.print(f"Every file was read again, although {parent[:8]} was given as parent", "RED")
+        elif ok is False and parent is not None and self.snapshotExists(parent) is False:
+            # the parent was forgotten or pruned, restic chooses one next time
+            parents.clear()
+
+    def backupShards(self, config, report):
+        """
+        back up the next shards of a large profile, every one as its own snapshot tagged shard:i/N
+        restic finds the parent of a shard itself, its paths stay the same between two plans
+        :return: True if all shards succeeded, runner of the last backup
+        """
+        from libs.ShardPlanner import ShardPlanner
+
+        planner = ShardPlanner(config["shards"], os.path.join(self.statePath, f"{self.profiles.profileName}-shards.json"))
+        shards = planner.plan(config["include"])
+        ok = True
+        runner = None
+        start = time.monotonic()
+        for number, index in enumerate(planner.nextShards()):
+            tag = planner.tag(index)
+            # the first shard always runs, so every run makes progress
+            if number > 0 and planner.fits(index, time.monotonic() - start) is False:
+                self.term.print(f"{tag} does not fit into the window, it is next in line", "YELLOW")
+                report.add("shards", tag, {"ok": None, "units": len(shards[index]), "skipped": "window"})
+                continue
+            self.term.print(f"Backing up {tag}")
+            started = time.monotonic()
+            includeFile = self.profiles.writeWorkFile(f"shard{index + 1}", "".join(f"{unit}\n" for unit in shards[index]))
+            cmd = self.createCmd(f'backup --files-from "{includeFile}" --exclude-file "{os.path.normpath(self.profiles.excludeFile)}" {self.backupOptions()} --tag "{tag}"')
+            self.log(cmd)
+            runner = self.createRunner(terminal=True)
+            runner.run_command(cmd)
+
+            size = None
+            if runner.returncode == 0:
+                snapshot = self.latestSnapshot(tag)
+                if snapshot is not None:
+                    size = snapshot.get("summary", {}).get("total_bytes_processed")
+            planner.finished(index, runner.returncode == 0, size, time.monotonic() - started)
+            report.add("shards", tag, {"ok": runner.returncode == 0, "units": len(shards[index])})
+            ok = ok and runner.returncode == 0
+
+        if planner.retired():
+            self.forgetTags(planner.retired())
+            planner.clearRetired()
+        self.term.print("done ...", "YELLOW")
+        report.addSection("coverage", planner.coverage())
+        return ok, runner
+
+    def backupSplit(self, config, report):
+        """
+        back up compressible and incompressible data at the same time with their own --compression
+        two snapshots tagged compression:<mode>, every one with the last snapshot of its group as parent
+        :return: True if both succeeded, runner of the normal backup
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from libs.CompressionSplit import CompressionSplit
+        from libs.ResourceBudget import CpuWatcher
+
+        splitter = CompressionSplit(config["compression_split"], os.path.join(self.statePath, f"{self.profiles.profileName}-entropy.json"))
+        incompressible = splitter.split(config["include"])
+        report.add("compression_split", "incompressible_entries", len(incompressible))
+        report.add("compression_split", "sampled_files", splitter.sampled)
+
+        # the normal backup leaves out what the other one takes
+        excludes = "".join(f"{item}\n" for item in config["exclude"]) + "".join(f"{glob.escape(path)}\n" for path in incompressible)
+        groups = {
+            "compressible": f'--files-from "{os.path.normpath(self.profiles.includeFile)}" --exclude-file "{self.profiles.writeWorkFile("exclude-split", excludes)}"',
+        }
+        if incompressible:
+            entries = self.profiles.writeWorkFile("incompressible", "".join(path + "\0" for path in incompressible))
+            groups["incompressible"] = f'--files-from-raw "{entries}" --exclude-file "{os.path.normpath(self.profiles.excludeFile)}"'
+
+        def run(group):
+            mode = splitter.getMode(group)
+            tag = f"compression:{mode}"
+            parent = self.latestSnapshot(tag)
+            options = f"{self.backupOptions()} --tag \"{tag}\" --compression {mode}"
+            if parent is not None:
+                options += f" --parent {parent['id']}"
+            runner = self.createRunner()
+            watcher = CpuWatcher()
+            runner.add_process_watcher(watcher)
+            cmd = self.createCmd(f"backup {groups[group]} {options}")
+            self.log(cmd)
+            runner.runCmd_Silent(cmd)
+            self.log(runner.getStdOut())
+            self.log(runner.getStdErr())
+
+            result = {"compression": mode, "ok": runner.returncode == 0, **watcher.stats()}
+            snapshot = self.latestSnapshot(tag) if runner.returncode == 0 else None
+            summary = snapshot.get("summary") if snapshot is not None else None
+            if summary is not None:
+                added = summary.get("data_added", 0)
+                packed = summary.get("data_added_packed", added)
+                result.update({"added_mib": round(added / 1048576, 1), "stored_mib": round(packed / 1048576, 1), "saved_mib": round((added - packed) / 1048576, 1)})
+            return runner, result
+
+        self.term.print(f"Backing up {', '.join(groups)} data")
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            results = dict(zip(groups, pool.map(run, groups)))
+        self.term.print("done ...", "YELLOW")
+
+        for group, (runner, result) in results.items():
+            report.add("compression_split", group, result)
+        return all(result["ok"] for runner, result in results.values()), results["compressible"][0]
+
+    def isWatched(self, config):
+        """back up only the changes recorded by --watch"""
+        if "watch" not in config or config["watch"].get("enabled", True) is False or OSDetector.is_linux() is False:
+            return False
+        return self.supports("json") and self.supports("files_from_raw", "--files-from-raw")
+
+    def forgetChanges(self):
+        """after a full backup the snapshots of changed paths before it are not needed any more"""
+        runner = self.createRunner()
+        runner.runCmd_Silent(self.createCmd(f'snapshots --json --tag "profile:{self.profiles.profileName},changes"'))
+        try:
+            ids = [snapshot["id"] for snapshot in json.loads(runner.getStdOut())]
+        except ValueError:
+            return
+        if ids:
+            self.runner.runCmd_Silent(self.createCmd(f"forget {' '.join(ids)}"))
+
+    def forgetTags(self, tags):
+        """forget every snapshot of the profile with one of the tags, e.g. the shards of a former plan"""
+        runner = self.createRunner()
+        runner.runCmd_Silent(self.createCmd(f"snapshots --json {self.profileTag()}"))
+        try:
+            ids = [snapshot["id"] for snapshot in json.loads(runner.getStdOut()) if set(snapshot.get("tags", [])) & set(tags)]
+        except ValueError:
+            return
+        if ids:
+            self.log(f"Forgetting {len(ids)} snapshots of {', '.join(tags)}")
+            self.runner.runCmd_Silent(self.createCmd(f"forget {' '.join(ids)}"))
+
+    def profileTag(self):
+        """tag of the snapshots of the actual profile"""
+        return f'--tag "profile:{self.profiles.profileName}"'
+
+    def backupOptions(self):
+        """every backup of the actual profile is tagged with it, and with the host if the profile sets one"""
+        options = self.profileTag()
+        if self.profiles.getHost() is not None:
+            options += f' --host "{self.profiles.getHost()}"'
+        return options
+
+    def forgetCmd(self, config):
+        """
+        keep the last n snapshots of the profile, of every shard or compression group if it has them
+        :return: the command, None while a new shard plan has not backed up every shard
+        """
+        if "shards" in config and self.shardsSettled(config) is False:
+            return None
+        cmd = f"forget --keep-last {config['snapshots']} {self.profileFilter()}"
+        if "shards" in config or "compression_split" in config:
+            cmd += " --group-by host,tags"
+        return self.createCmd(cmd)
+
+    def shardsSettled(self, config):
+        """after a new plan units have moved, the old snapshots are needed until every shard has run"""
+        from libs.ShardPlanner import ShardPlanner
+
+        return ShardPlanner(config["shards"], os.path.join(self.statePath, f"{self.profiles.profileName}-shards.json")).settled()
+
+    def profileFilter(self):
+        """
+        select the snapshots of the actual profile for forget, snapshots and ls
+        untagged snapshots are made by older versions, they still belong to the profile
+        """
+        options = f'{self.profileTag()} --tag ""'
+        if self.profiles.getHost() is not None:
+            options += f' --host "{self.profiles.getHost()}"'
+        return options
+
+    def latestSnapshot(self, tag=None):
+        """
+        the newest full snapshot of the file backup of the actual profile, streams and changes are left out
+        :param tag: only snapshots with this tag too, e.g. shard:1/4
+        :return: snapshot dict, None if unknown
+        """
+        if self.supports("json") is False:
+            return None
+        tags = f"profile:{self.profiles.profileName}" if tag is None else f"profile:{self.profiles.profileName},{tag}"
+        runner = self.createRunner()
+        # in a repository shared by several computers only the own snapshots may become the parent
+        runner.runCmd_Silent(self.createCmd(f'snapshots --json --tag "{tags}" --host "{self.snapshotHost()}"'))
+        try:
+            snapshots = json.loads(runner.getStdOut())
+        except ValueError:
+            return None
+        snapshots = [snapshot for snapshot in snapshots if not any(tag.startswith("stream:") or tag == "changes" for tag in snapshot.get("tags", []))]
+        if len(snapshots) == 0:
+            return None
+        return max(snapshots, key=lambda snapshot: snapshot["time"])
+
+    def snapshotHost(self):
+        """host name restic writes into the snapshots of the actual profile"""
+        if self.profiles.getHost() is not None:
+            return self.profiles.getHost()
+        import socket
+
+        return socket.gethostname()
+
+    def snapshotExists(self, snapshot):
+        """
+        False only if restic reports that the snapshot is not in the repository,
+        an unreachable repository or a lock counts as existing
+        """
+        runner = self.createRunner()
+        runner.runCmd_Silent(self.createCmd(f"cat snapshot {snapshot}"))
+        if runner.returncode == 0:
+            return True
+        self.log(runner.getStdErr())
+        return re.search(r"no matching ID found", runner.getStdErr()) is None
+
+    def replicate(self, storages=None):
+        """
+        copy the new snapshots of the actual profile to its secondary repositories
+        :param storages: only these secondaries, all if None
+        """
+        from libs.Replicator import Replicator
+
+        self.term.print(f"Copying new snapshots to {len(storages or self.profiles.getSecondaries())} secondary repositories")
+        results = Replicator(self, self.getSnapshotCache()).replicate(storages)
+        for storage, result in results.items():
+            if result["ok"] is False:
+                self.term.print(f"Copy to {storage} failed: {result['error']}, deferred", "RED")
+        return results
+
+    def deferredSecondaries(self, profile_name):
+        """secondaries the last backup of a profile could not copy to"""
+        report = self.readReport(profile_name, "backup") or {}
+        return [storage for storage, result in report.get("replication", {}).items() if result.get("deferred")]
+
+    def replicateDeferred(self, profile_name="default"):
+        """
+        copy again to the secondaries the last backup of a profile could not copy to
+        :return: True if all of them have the snapshots now
+        """
+        config = self.loadProfile(profile_name)
+        if config is False:
+            return False
+        storages = self.deferredSecondaries(profile_name)
+        report = RunReport(profile_name, "replicate")
+        results = self.replicate(storages) if storages else {}
+        report.addSection("replication", results)
+        self.finishReport(report)
+        return all(result["ok"] for result in results.values())
+
+    def getSnapshotCache(self):
+        """cached snapshot lists of all repositories in bin/snapshots.db"""
+        from libs.SnapshotCache import SnapshotCache
+
+        return SnapshotCache(os.path.join(self.binPath, "snapshots.db"))
+
+    def refreshSnapshots(self, storage=None, passwordOption=None):
+        """
+        bring the cached snapshots of a repository up to date
+        restic list snapshots only lists the snapshot files, just the new ones are loaded
+        :param storage: repository, the one of the profile if None
+        :return: list of snapshot dicts, None if restic failed or does not know --json
+        """
+        if self.supports("json") is False:
+            return None
+        storage = self.profiles.getStoragePath() if storage is None else storage
+        cache = self.getSnapshotCache()
+        runner = self.createRunner()
+
+        if cache.repositoryId(storage) is None:
+            runner.runCmd_Silent(self.createCmd("cat config", storage, passwordOption))
+            try:
+                cache.setRepositoryId(storage, json.loads(runner.getStdOut())["id"])
+            except (ValueError, KeyError):
+                self.log(runner.getStdErr())
+                return None
+
+        runner.runCmd_Silent(self.createCmd("list snapshots", storage, passwordOption))
+        if runner.returncode != 0:
+            self.log(runner.getStdErr())
+            return None
+        ids = set(line.strip() for line in runner.getStdOut().splitlines() if line.strip())
+        known = cache.ids(storage)
+        new = ids - known
+
+        added = []
+        if new:
+            # a few ids on the command line, else all of them
+            selection = " ".join(sorted(new)) if len(new) <= 100 else ""
+            runner.runCmd_Silent(self.createCmd(f"snapshots --json {selection}", storage, passwordOption))
+            try:
+                added = [snapshot for snapshot in json.loads(runner.getStdOut()) if snapshot["id"] in new]
+            except ValueError:
+                self.log(runner.getStdErr())
+                return None
+        cache.update(storage, added, known - ids)
+        return cache.get(storage)
+
+    def backupMany(self, profile_names, workers=4):
+        """
+        backup several profiles concurrently, profiles with the same storage one after the other
+        restic output of every profile goes to bin/logs/<profile>.log
+        :param profile_names: list of profile names
+        :param workers: how many storages are backed up at the same time
+        """
+        return self.runMany(profile_names, "backup", workers)
+
+    def runMany(self, profile_names, operation, workers=4):
+        """
+        run backup, check, stats or replicas of several profiles concurrently
+        jobs on the same storage run one after the other. check and stats read a whole repository,
+        a backend runs at most max_per_backend of them at once (settings.yml), backups of different
+        storages always run in parallel. The reports of all profiles are collected in
+        bin/reports/summary-<operation>.json
+        :param profile_names: list of profile names
+        :param operation: backup, check or stats
+        :param workers: how many storages are worked on at the same time
+        :return: True if all jobs succeeded
+        """
+        from libs.Orchestrator import Orchestrator
 
-                self.runner.runCmd(cmd, "Maintaince Snapshots  ")
+        for profile_name in profile_names:
+            if profile_name not in self.profiles.getProfiles():
+                self.profiles.msgProfileNotExists(profile_name)
+                return False
+
+        settings = self.Configuration.load_settings()
+        self.term.print(f"Running {operation} of {len(profile_names)} profiles, {workers} at the same time")
+        if operation in self.BACKEND_LIMITED:
+            orchestrator = Orchestrator(workers, settings["max_per_backend"], settings["backend_limits"])
+        else:
+            orchestrator = Orchestrator(workers)
+        for profile_name in profile_names:
+            storage = self.configDict[profile_name]["storage"]
+            orchestrator.submit(profile_name, storage, lambda name=profile_name: self.runJob(name, operation))
+
+        report = RunReport("summary", operation)
+        results = orchestrator.run()
+        finished = time.monotonic()
+        for result in results:
+            result["report"] = self.readReport(result["profile"], operation)
+            report.add("profiles", result["profile"], result)
+
+        # failed copies to secondaries are retried after all backups, so they never hold a lane
+        deferred = [result for result in results if operation == "backup" and self.deferredSecondaries(result["profile"])]
+        if deferred:
+            from libs.Replicator import Replicator
+
+            time.sleep(max(0, Replicator.DEFER - (time.monotonic() - finished)))
+            self.term.print(f"Copying again to the secondaries of {len(deferred)} profiles")
+            retry = Orchestrator(workers)
+            for result in deferred:
+                retry.submit(result["profile"], result["storage"], lambda name=result["profile"]: self.runJob(name, "replicateDeferred"))
+            for retried in retry.run():
+                result = next(result for result in deferred if result["profile"] == retried["profile"])
+                result["ok"] = result["ok"] and retried["ok"]
+                result["replication_retry"] = self.readReport(retried["profile"], "replicate")
+        report.save(self.reportsPath)
+
+        orchestrator.printSummary(self.term, results)
+        self.term.print(f"Logs: {self.logsPath}", "YELLOW")
+        self.term.print(f"Report: {os.path.join(self.reportsPath, f'summary-{operation}.json')}", "YELLOW")
+        return all(r["ok"] for r in results)
+
+    def readReport(self, profile_name, operation):
+        """the stored report of the last run, None if there is none"""
+        try:
+            with open(os.path.join(self.reportsPath, f"{profile_name}-{operation}.json"), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def profileNames(self, value):
+        """profile names of a comma separated list, all = every profile"""
+        if value == "all":
+            return list(self.profiles.getProfiles())
+        return [name.strip() for name in value.split(",") if name.strip() != ""]
+
+    def runJob(self, profile_name, operation):
+        """
+        run backup, prune, check or stats in its own quiet Restic object, one per thread
+        :return: True on success
+        """
+        restic = Restic(quiet=True)
+        restic.setLogFile(os.path.join(self.logsPath, f"{profile_name}.log"))
+        restic.log(f"---- {datetime.now().isoformat(timespec='seconds')} {operation} [{profile_name}]")
+        return getattr(restic, operation)(profile_name)
+
+    def prune(self, profile_name="default"):
+        """
+        keep n snapshots and free space
+        :return: True if restic finished without errors
+        """
+        config = self.loadProfile(profile_name)
+        if config is not False:
+            if self.testRepoInit() is True:
+                cmd = self.forgetCmd(config)
+                if cmd is None:
+                    self.term.print("New shard plan, snapshots are kept until every shard was backed up", "YELLOW")
+                else:
+                    self.runWithSpinner(cmd, "Maintaince Snapshots  ")
+                    if self.runner.returncode != 0:
+                        return False
+
+                cmd = self.createCmd("prune")
+                self.runner.runCmd(cmd)
                 self.term.print("done ...", "YELLOW")
+                ok = self.runner.returncode == 0
+                self.refreshSnapshots()
+                return ok
+        return False
+
+    def watch(self):
+        """record the changed paths of all profiles with a watch block until Ctrl+C (Linux)"""
+        from libs.ChangeJournal import ChangeJournal
+        from libs.ChangeWatcher import ChangeWatcher
+
+        if OSDetector.is_linux() is False:
+            self.term.print("--watch needs inotify (Linux) ...", "RED")
+            return False
 
-            else:
-                self.term.print("-exit-", "YELLOW")
+        watcher = ChangeWatcher(self.term)
+        for profile_name, config in self.configDict.items():
+            if "watch" in config and config["watch"].get("enabled", True):
+                watcher.add(profile_name, config["include"], ChangeJournal(self.statePath, profile_name, config["watch"]))
+        if len(watcher.roots) == 0:
+            self.term.print("No profile has a watch block ...", "RED")
+            return False
+        watcher.run()
+        return True
+
+    def daemon(self, workers=2):
+        """run the schedules of all profiles until Ctrl+C"""
+        from libs.Daemon import Daemon
+
+        settings = self.Configuration.load_settings()
+        daemon = Daemon(self.Configuration, self.runJob, os.path.join(self.statePath, "daemon.json"), workers, term=self.term, perBackend=settings["max_per_backend"], backendLimits=settings["backend_limits"])
+        daemon.run()
 
     def stats(self, profile_name="default"):
-        """Statistics about Repo"""
+        """
+        Statistics about Repo
+        :return: True if restic finished without errors
+        """
         self.term.print("Get statistics from Repository")
 
-        config = self.profiles.loadProfile_and_setVariables(profile_name)
+        config = self.loadProfile(profile_name)
         if config is not False:
             if self.testRepoInit() is True:
+                report = RunReport(profile_name, "stats")
+                cache = self.startCache()
+
                 # stats
-                cmd = self.createCmd("stats")
-                runner = CmdRunner_Terminal()
-                runner.run_command(cmd)
+                if self.supports("json"):
+                    runner = self.createRunner()
+                    runner.runCmd_Silent(self.createCmd("stats --mode raw-data --json"))
+                    try:
+                        report.addSection("stats", json.loads(runner.getStdOut()))
+                    except ValueError:
+                        self.log(runner.getStdErr())
+                else:
+                    runner = self.createRunner(terminal=True)
+                    runner.run_command(self.createCmd("stats"))
 
                 self.term.print("done ...", "YELLOW")
+                report.add("stats", "returncode", runner.returncode)
+                report.addSection("resources", runner.getWatcherStats())
+                report.addSection("cache", cache.finishRun())
+                self.finishReport(report)
+                return runner.returncode == 0
+        return False
 
     def check(self, profile_name="default"):
-        """Check s Repo"""
+        """
+        Check s Repo
+        :return: True if restic found no errors
+        """
         self.term.print(f"Check Repository: {profile_name}")
 
-        config = self.profiles.loadProfile_and_setVariables(profile_name)
+        config = self.loadProfile(profile_name)
         if config is not False:
             if self.testRepoInit() is True:
-                # stats
-                cmd = self.createCmd("check")
-                runner = CmdRunner_Terminal()
-                runner.run_command(cmd)
+                report = RunReport(profile_name, "check")
+                cache = self.startCache()
+                rotation = CheckRotation(config.get("check"), os.path.join(self.statePath, f"{profile_name}-check.json"))
+
+                if "check" not in config or rotation.isEnabled() is False:
+                    runner = self.createRunner(terminal=True)
+                    runner.run_command(self.createCmd("check"))
+                    ok = runner.returncode == 0
+                else:
+                    runner, ok = self.checkSubsets(rotation, report)
 
                 self.term.print("done ...", "YELLOW")
+                report.add("check", "ok", ok)
+                report.addSection("resources", runner.getWatcherStats())
+                report.addSection("cache", cache.finishRun())
+                self.finishReport(report)
+                return ok
+        return False
+
+    def checkSubsets(self, rotation, report):
+        """
+        read the next subsets of the rotation, more than one if the time budget allows
+        :return: last runner, True if all subsets are ok
+        """
+        repo_bytes = 0
+        if rotation.needsRepoSize():
+            repo_bytes = self.getRepoSize()
+        rotation.plan(repo_bytes)
+
+        ok = True
+        subsets = []
+        start = datetime.now()
+        while True:
+            option = rotation.nextSubset()
+            self.term.print(f"Reading data {option.split('=')[1]}", "YELLOW")
+            sliceStart = datetime.now()
+            runner = self.createRunner(terminal=True)
+            runner.run_command(self.createCmd(f"check {option}"))
+            rotation.finished(runner.returncode == 0)
+            subsets.append(option.split("=")[1])
+            if runner.returncode != 0:
+                ok = False
+                break
+
+            elapsed = (datetime.now() - start).total_seconds()
+            duration = (datetime.now() - sliceStart).total_seconds()
+            if rotation.hasTimeFor(elapsed, duration, len(subsets)) is False:
+                break
+
+        coverage = rotation.coverage()
+        report.add("check", "subsets_read", subsets)
+        report.addSection("coverage", coverage)
+        if coverage["overdue"]:
+            self.term.print("Not every subset was read in the last read_data_days days, run check more often", "RED")
+        return runner, ok
+
+    def getRepoSize(self):
+        """size of all pack files in bytes, 0 if unknown"""
+        if self.supports("json") is False:
+            return 0
+        self.runner.runCmd_Silent(self.createCmd("stats --mode raw-data --json"))
+        try:
+            return int(json.loads(self.runner.getStdOut())["total_size"])
+        except (ValueError, KeyError, TypeError):
+            return 0
 
     def snapshots(self, profile_name="default"):
         """list all snapshots"""
         self.term.print(f"Snapshots stored in Repository: {profile_name}")
 
-        config = self.profiles.loadProfile_and_setVariables(profile_name)
+        config = self.loadProfile(profile_name)
         if config is not False:
             if self.testRepoInit() is True:
+                report = RunReport(profile_name, "snapshots")
+                cache = self.startCache()
+
                 # stats
-                cmd = self.createCmd("snapshots")
-                runner = CmdRunner_Terminal()
+                cmd = self.createCmd(f"snapshots {self.profileFilter()}")
+                runner = self.createRunner(terminal=True)
                 runner.run_command(cmd)
 
                 self.term.print("done ...", "YELLOW")
+                report.addSection("resources", runner.getWatcherStats())
+                report.addSection("cache", cache.finishRun())
+                self.finishReport(report)
+
+    def replicas(self, profile_name="default"):
+        """
+        compare the snapshots of a profile with its secondaries, from the cached snapshot lists
+        the caches are brought up to date with restic list snapshots, only new snapshots are loaded
+        :return: True if every secondary has all snapshots unchanged
+        """
+        from libs.ReplicaCheck import ReplicaCheck
+
+        self.term.print(f"Comparing replicas of [{profile_name}]")
+        config = self.loadProfile(profile_name)
+        if config is False:
+            return False
+        if len(self.profiles.getSecondaries()) == 0:
+            self.term.print("The profile has no secondaries ...", "RED")
+            return False
+
+        report = RunReport(profile_name, "replicas")
+        snapshots = self.refreshSnapshots()
+        if snapshots is None:
+            self.term.print("Snapshots of the repository are unknown ...", "RED")
+            return False
+        # only the snapshots replicate copies, other profiles may share the repositories
+        snapshots = [snapshot for snapshot in snapshots if self.isOwnSnapshot(snapshot)]
+
+        ok = True
+        for index, secondary in enumerate(self.profiles.getSecondaries()):
+            replicaSnapshots = self.refreshSnapshots(secondary["storage"], self.profiles.getSecondaryPasswordOption(index))
+            if replicaSnapshots is None:
+                result = {"ok": False, "error": "snapshots unknown"}
+            else:
+                result = ReplicaCheck(snapshots, [snapshot for snapshot in replicaSnapshots if self.isOwnSnapshot(snapshot)]).compare()
+            ok = ok and result["ok"]
+            report.addSection(secondary["storage"], result)
+
+        self.finishReport(report)
+        return ok
+
+    def tune(self, profile_name="default"):
+        """calibrate the tuning options of a profile against its storage"""
+        self.term.print(f"Tuning profile [{profile_name}]")
+
+        config = self.loadProfile(profile_name)
+        if config is not False:
+            from libs.Tuner import Tuner
+
+            report = RunReport(profile_name, "tune")
+            tuner = Tuner(self)
+            best = tuner.tune()
+            for i, result in enumerate(tuner.results):
+                report.add("trials", str(i), result)
+
+            if best is None:
+                self.term.print("Tuning failed, config.yml is unchanged ...", "RED")
+            else:
+                report.addSection("best", best)
+                new_config = self.load_yml()
+                new_config[profile_name].update(best)
+                self.Configuration.save_config(new_config, self.Configuration.getConfigFilePath())
+                self.configDict = new_config
+                self.profiles.setConfigDict(new_config)
+                self.term.print(f"Profile [{profile_name}] updated in config.yml ...", "YELLOW")
+            self.finishReport(report)
 
     def process_output(self, line):
         # Process each line as it comes
@@ -305,13 +1175,15 @@ class Restic:
         """list all snapshots"""
         self.term.print(f"List all files stored in Repository: {profile_name}")
 
-        config = self.profiles.loadProfile_and_setVariables(profile_name)
+        config = self.loadProfile(profile_name)
         if config is not False:
             if self.testRepoInit() is True:
                 # stats
-                cmd = self.createCmd("ls latest")
+                # the last file backup, latest could be a stream
+                parent = ParentTracker(os.path.join(self.statePath, f"{profile_name}-parent.json")).get()
+                cmd = self.createCmd(f"ls {parent}" if parent else f"ls latest {self.profileFilter()}")
 
-                runner = CmdRunner()
+                runner = self.createRunner()
                 runner.add_stdout_listener(self.process_output)
                 runner.runCmd(cmd)
 
@@ -397,15 +1269,19 @@ class Restic:
         return match.group(1) if match else None
 
     def loadSnapshots(self, config):
-        """get all snapshots from Repository"""
+        """get all snapshots of the profile, from the snapshot cache if restic knows --json"""
+        import questionary
+
         if self.testRepoInit() is True:
-            # stats
-            cmd = self.createCmd("snapshots")
-            runner = CmdRunner()
-            runner.runCmd(cmd)
+            snapshots = self.refreshSnapshots()
+            if snapshots is not None:
+                lines = [self.snapshotInfo(snapshot) for snapshot in snapshots if self.isProfileSnapshot(snapshot)]
+            else:
+                cmd = self.createCmd(f"snapshots {self.profileFilter()}")
+                runner = self.createRunner()
+                runner.runCmd(cmd)
+                lines = self.extract_backup_info(runner.getStdOutLines())
 
-            lines = runner.getStdOutLines()
-            lines = self.extract_backup_info(lines)
             snappys = []
             for line in lines:
                 dt = datetime.strptime(line["date"], "%Y-%m-%d %H:%M:%S")
@@ -414,11 +1290,34 @@ class Restic:
                 sstr = f"{date}: id={line['id']} ({line['size']})"
                 snappys.append(sstr)
 
-                snappys = list(reversed(snappys))
+            snappys = list(reversed(snappys))
 
             id = questionary.select("Choose a snapshot to restore?", choices=snappys).ask()
             return self.extract_id(id)
 
+    def isOwnSnapshot(self, snapshot):
+        """a snapshot tagged with the actual profile and made on this host, untagged ones do not count"""
+        return f"profile:{self.profiles.profileName}" in snapshot.get("tags", []) and snapshot.get("hostname") == self.snapshotHost()
+
+    def isProfileSnapshot(self, snapshot):
+        """the cached version of profileFilter()"""
+        tags = snapshot.get("tags", [])
+        if len(tags) > 0 and f"profile:{self.profiles.profileName}" not in tags:
+            return False
+        return self.profiles.getHost() is None or snapshot.get("hostname") == self.profiles.getHost()
+
+    def snapshotInfo(self, snapshot):
+        """id, date and size of a cached snapshot, like extract_backup_info"""
+        size = snapshot.get("summary", {}).get("total_bytes_processed")
+        text = ""
+        if size is not None:
+            for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+                if size < 1024 or unit == "TiB":
+                    text = f"{size:.3f} {unit}"
+                    break
+                size /= 1024
+        return {"id": snapshot["id"][:8], "date": snapshot["time"][:19].replace("T", " "), "size": text}
+
     def get_desktop_path(self):
         """Get the user's Desktop path"""
         # Try standard user profile desktop
@@ -431,10 +1330,12 @@ class Restic:
 
     def restore(self, profile_name="default"):
         """restore a snapshot"""
+        import questionary
+
         self.term.print(f"Restoring snapshot from Repository: {profile_name}")
         self.term.print("Loading snaphots ...\n", "YELLOW")
 
-        config = self.profiles.loadProfile_and_setVariables(profile_name)
+        config = self.loadProfile(profile_name)
         if config is not False:
             if self.testRepoInit() is True:
                 # load snapshots
@@ -446,7 +1347,7 @@ class Restic:
                     # restic -r <path> restore <id>  --target /tmp/restore-work -p $PWDFILE
                     cmd = self.createCmd(f"restore {id} --target {os.path.normpath(target)}")
                     print(cmd)
-                    runner = CmdRunner_Terminal()
+                    runner = self.createRunner(terminal=True)
                     runner.run_command(cmd)
 
                     self.term.print("done ...", "YELLOW")
@@ -458,16 +1359,23 @@ class Restic:
             os.remove(filename)
 
     def checkBinFileRestic(self):
-        """Windows binary loaded?"""
-        if OSDetector.is_windows() is False:
+        """restic binary there? if not, it is downloaded from GitHub into bin"""
+        if OSDetector.is_windows() is False and OSDetector.is_linux() is False:
             return
 
-        # we have windows
         file = self.getResticPath()
         if file is None:
-            # we had to download it
-            github = GitHub("restic", "restic")
-            release_info = github.get_latest_release_info()
+            # we had to download it, requests and tqdm are only loaded here
+            from libs.GitHub import GitHub, Platform, Architecture
+
+            settings = self.Configuration.load_settings()
+            # an empty restic_version: loads as None
+            version = str(settings["restic_version"]) if settings["restic_version"] else None
+            github = GitHub("restic", "restic", cache_dir=os.path.join(self.binPath, "github"), ttl=settings["release_cache_ttl"])
+            if settings["restic_mirror"]:
+                release_info = github.get_mirror_release_info(settings["restic_mirror"], version)
+            else:
+                release_info = github.get_latest_release_info(version)
 
             self.term.print("No executable restic found ...")
             self.term.print("Will download it ...")
@@ -477,17 +1385,34 @@ class Restic:
                 self.term.print(f"URL: {release_info['url']}")
                 self.term.print(f"Published: {release_info['published_at']}")
 
-            windows_url = github.get_platform_download(Platform.WINDOWS, Architecture.AMD64)
-            filename = os.path.basename(windows_url)
+            platform = Platform.WINDOWS if OSDetector.is_windows() else Platform.LINUX
+            url = github.get_platform_download(platform, Architecture.current())
+            if url is None:
+                self.term.print("No restic download found for this system ...", "RED")
+                sys.exit(-1)
 
-            output_file = os.path.normpath(os.path.join(self.binPath, filename))
-            github.download_file(windows_url, output_file)
-            github.unzip_file(output_file, self.binPath)
+            output_file = os.path.normpath(os.path.join(self.binPath, os.path.basename(url)))
+            if github.download_verified(url, output_file) is False or github.extract_binary(output_file, self.binPath) is None:
+                self.term.print("Download of restic failed, run again to resume it ...", "RED")
+                sys.exit(-1)
 
             self.rmFile(output_file)
+            self.term.print(f"\nDone ... restic installed to {self.binPath}")
 
-            self.term.print("\nDone ... please restart the app ...")
-            sys.exit()
+
+# commands which run for several profiles at the same time with a, b, c (and all, except backup)
+MANY_COMMANDS = ["backup", "stats", "check", "replicas"]
+
+
+def runCommand(restic, command, value, workers):
+    """run a command of the command line for one profile, or for several of them concurrently"""
+    if command in MANY_COMMANDS and ("," in value or (value == "all" and command != "backup")):
+        ok = restic.runMany(restic.profileNames(value), command, workers)
+        sys.exit(0 if ok else 1)
+
+    result = getattr(restic, command)(value)
+    if command == "replicas":
+        sys.exit(0 if result else 1)
 
 
 @click.command(no_args_is_help=False)
@@ -501,7 +1426,21 @@ class Restic:
     "--backup",
     type=(str),
     required=False,
-    help="Backup with Restic TEXT=Profile name",
+    help="Backup with Restic TEXT=Profile name, or several comma separated names",
+)
+@click.option(
+    "--all",
+    "backup_all",
+    required=False,
+    is_flag=True,
+    help="Backup all profiles concurrently",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=4,
+    show_default=True,
+    help="How many repositories are worked on at the same time with --all, --daemon or a list of profiles",
 )
 @click.option(
     "--restore",
@@ -513,7 +1452,7 @@ class Restic:
     "--check",
     type=(str),
     required=False,
-    help="Check a Backup TEXT=Profile name",
+    help="Check a Backup TEXT=Profile name, a,b,c or all",
 )
 @click.option(
     "--snapshots",
@@ -531,7 +1470,31 @@ class Restic:
     "--stats",
     type=(str),
     required=False,
-    help="Get some statistic about the repository TEXT=Profile name",
+    help="Get some statistic about the repository TEXT=Profile name, a,b,c or all",
+)
+@click.option(
+    "--replicas",
+    type=(str),
+    required=False,
+    help="Compare the snapshots of a profile with its secondaries TEXT=Profile name, a,b,c or all",
+)
+@click.option(
+    "--tune",
+    type=(str),
+    required=False,
+    help="Calibrate read concurrency, pack size and compression against the storage TEXT=Profile name",
+)
+@click.option(
+    "--daemon",
+    required=False,
+    is_flag=True,
+    help="Run the schedules of all profiles (backup, prune, check) until Ctrl+C, uses --workers",
+)
+@click.option(
+    "--watch",
+    required=False,
+    is_flag=True,
+    help="Record changed files of the profiles with a watch block, the next backup covers only them (Linux)",
 )
 @click.option(
     "--profiles",
@@ -545,16 +1508,9 @@ class Restic:
     is_flag=True,
     help="Display some Informations about a Backup TEXT=Profile name",
 )
-def start(backup, restore, check, help, init, stats, profiles, snapshots, list):
+def start(backup, backup_all, workers, restore, check, help, init, stats, profiles, snapshots, list, replicas, tune, daemon, watch):
     restic = Restic()
 
-    # debug
-    # restic.profileManagement()
-    #
-
-    restic.backup("video")
-    sys.exit()
-
     if profiles:
         restic.profileManagement()
 
@@ -562,32 +1518,24 @@ def start(backup, restore, check, help, init, stats, profiles, snapshots, list):
         profile_name = init
         restic.init(profile_name)
 
-    elif backup:
-        profile_name = backup
-        restic.backup(profile_name)
-
-    elif help:
-        restic.help()
+    elif daemon:
+        restic.daemon(workers)
 
-    elif stats:
-        profile_name = stats
-        restic.stats(profile_name)
+    elif watch:
+        sys.exit(0 if restic.watch() else 1)
 
-    elif snapshots:
-        profile_name = snapshots
-        restic.snapshots(profile_name)
+    elif backup_all:
+        ok = restic.backupMany(restic.profileNames("all"), workers)
+        sys.exit(0 if ok else 1)
 
-    elif list:
-        profile_name = list
-        restic.list(profile_name)
+    elif help:
+        restic.help()
 
-    elif restore:
-        profile_name = restore
-        restic.restore(profile_name)
+    elif any([backup, stats, snapshots, list, restore, check, replicas, tune]):
+        commands = [("backup", backup), ("stats", stats), ("snapshots", snapshots), ("list", list), ("restore", restore), ("check", check), ("replicas", replicas), ("tune", tune)]
+        command, value = next((command, value) for command, value in commands if value)
+        runCommand(restic, command, value, workers)
 
-    elif check:
-        profile_name = check
-        restic.check(profile_name)
     else:
         # Display Help Informations and Usage
         ctx = click.get_current_context()
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from libs.LoadThrottle import LoadThrottle  # noqa: E402
+from libs.ProcessTree import ProcessTree  # noqa: E402
+
+pytestmark = pytest.mark.skipif(ProcessTree.supported() is False, reason="needs /proc (Linux)")
+
+# a child with a few threads which exist before the throttle starts, like the Go workers of restic
+CHILD = """
+import threading, time
+for _ in range(4):
+    threading.Thread(target=time.sleep, args=(30,), daemon=True).start()
+print("ready", flush=True)
+time.sleep(30)
+"""
+
+
+def niceOf(pid, tid):
+    with open(f"/proc/{pid}/task/{tid}/stat") as fh:
+        return int(fh.read().rsplit(")", 1)[1].split()[16])
+
+
+@pytest.fixture
+def child():
+    proc = subprocess.Popen([sys.executable, "-c", CHILD], stdout=subprocess.PIPE, text=True)
+    assert proc.stdout.readline().strip() == "ready"
+    yield proc
+    proc.kill()
+    proc.wait()
+
+
+def test_nice_throttle_lowers_every_thread(child):
+    tids = ProcessTree.threads(child.pid)
+    assert len(tids) >= 5
+    before = {tid: niceOf(child.pid, tid) for tid in tids}
+
+    throttle = LoadThrottle({"mode": "nice"})
+    throttle.pid = child.pid
+    throttle._throttle()
+    assert all(niceOf(child.pid, tid) == 19 for tid in tids)
+
+    throttle._release()
+    if os.geteuid() == 0:
+        # only root may raise the priority again
+        assert {tid: niceOf(child.pid, tid) for tid in tids} == before
+
+
+def test_release_restores_io_class_of_every_thread(child):
+    if subprocess.run(["sh", "-c", "command -v ionice"], capture_output=True).returncode != 0:
+        pytest.skip("needs ionice")
+    tids = ProcessTree.threads(child.pid)
+    for tid in tids:
+        subprocess.run(["ionice", "-c", "2", "-n", "6", "-p", str(tid)], check=True)
+
+    throttle = LoadThrottle({"mode": "nice"})
+    throttle.pid = child.pid
+    throttle._throttle()
+    time.sleep(0.1)
+    assert all(subprocess.run(["ionice", "-p", str(tid)], capture_output=True, text=True).stdout.strip() == "idle" for tid in tids)
+
+    throttle._release()
+    assert all(subprocess.run(["ionice", "-p", str(tid)], capture_output=True, text=True).stdout.strip() == "best-effort: prio 6" for tid in tids)